@@ -0,0 +1,95 @@
+# ai/answer_cache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import math
+import threading
+import time
+
+
+def _normalize(vec: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas del LLM por similitud semántica de la pregunta.
+
+    Las entradas se agrupan por `context_key` (ids de los hits + hash del
+    contexto + versión del template + modelo): solo se compara contra
+    preguntas que recibieron EXACTAMENTE el mismo contexto, así cualquier
+    cambio en lo recuperado fuerza regenerar. Dentro del grupo se busca la
+    pregunta más parecida (coseno) sobre `threshold`.
+    """
+
+    def __init__(self, maxsize: int = 256, threshold: float = 0.95, ttl_s: Optional[float] = None):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        # context_key -> [(entry_id, vec_normalizado)]
+        self._groups: Dict[Hashable, List[Tuple[int, List[float]]]] = {}
+        # entry_id -> (context_key, expira_en, respuesta), en orden LRU
+        self._entries: "OrderedDict[int, Tuple[Hashable, Optional[float], str]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, context_key: Hashable, question_vec: List[float]) -> Optional[str]:
+        q = _normalize(question_vec)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id, vec in list(self._groups.get(context_key, [])):
+                _, expires, _ = self._entries[entry_id]
+                if expires is not None and expires <= now:
+                    self._evict(entry_id)
+                    continue
+                sim = sum(a * b for a, b in zip(q, vec))
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2]
+
+    def put(self, context_key: Hashable, question_vec: List[float], answer: str) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl_s if self.ttl_s else None
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._groups.setdefault(context_key, []).append((entry_id, _normalize(question_vec)))
+            self._entries[entry_id] = (context_key, expires, answer)
+            while len(self._entries) > self.maxsize:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, entry_id: int) -> None:
+        context_key, _, _ = self._entries.pop(entry_id)
+        group = [e for e in self._groups.get(context_key, []) if e[0] != entry_id]
+        if group:
+            self._groups[context_key] = group
+        else:
+            self._groups.pop(context_key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._groups.clear()
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -1,19 +1,22 @@
 # ai/chat.py
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import hashlib
 import os
+import re
 import time
 
-import config
-from bd.chroma_store import search as chroma_search
-
-# OpenAI (opcional)
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
+from bd.chroma_store import search as chroma_search, asearch as chroma_asearch
+from bd.chroma_store import embed_query, aembed_query, run_retrieval
+from ai.llm_client import api_key, get_client, get_async_client
+from ai.answer_cache import SemanticAnswerCache
+from ai.memory import ConversationStore
+from ai.context import build_context, format_distance, DEFAULT_CONTEXT_TOKENS
+from ai.tokens import count_tokens
+from metrics import span, STAGE_SECONDS
 
 
 # -----------------------------
@@ -41,12 +44,59 @@ INSTRUCCIONES:
 RESPUESTA:
 """
 
+HISTORY_TEMPLATE_ES = """\
+HISTORIAL DE LA CONVERSACIÓN (úsalo solo para entender preguntas de seguimiento):
+{history}
+
+"""
+
+# Cambia automáticamente si se edita cualquiera de los templates
+PROMPT_TEMPLATE_VERSION = hashlib.sha1(
+    (SYSTEM_PROMPT_ES + USER_TEMPLATE_ES + HISTORY_TEMPLATE_ES).encode("utf-8")
+).hexdigest()[:12]
+
 
 # -----------------------------
 # Configuración
 # -----------------------------
 DEFAULT_TOP_K = 3
-DEFAULT_MAX_CHARS_PER_DOC = 2000
+# El contexto se acota por tokens (DEFAULT_CONTEXT_TOKENS); el corte por
+# caracteres queda solo como tope opcional por documento.
+DEFAULT_MAX_CHARS_PER_DOC: Optional[int] = None
+
+# Caché semántica de respuestas del LLM
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+
+_answer_cache = SemanticAnswerCache(
+    maxsize=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_s=ANSWER_CACHE_TTL_S,
+)
+
+# Preguntas de seguimiento ("¿y en flotación?", "explica eso", "lo anterior"):
+# su respuesta depende del historial, así que no pasan por la caché. Las demás
+# se responden desde el contexto recuperado y la clave no incluye el historial.
+_FOLLOW_UP_RE = re.compile(
+    r"^(y|pero|entonces|también|tambien|además|ademas|o sea)\b"
+    r"|\b(eso|esto|esa|ese|esos|esas|aquello|anterior|anteriores|mencionaste|dijiste|explicaste"
+    r"|lo mismo|más detalle|mas detalle)\b",
+    re.I,
+)
+
+# Memoria de conversación por chat_id (MEMORY_DB_PATH activa respaldo SQLite)
+MEMORY_MAX_CHATS = int(os.getenv("MEMORY_MAX_CHATS", "1000"))
+MEMORY_WINDOW_TOKENS = int(os.getenv("MEMORY_WINDOW_TOKENS", "1000"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "")
+
+_memory = ConversationStore(
+    max_chats=MEMORY_MAX_CHATS,
+    window_tokens=MEMORY_WINDOW_TOKENS,
+    summary_tokens=MEMORY_SUMMARY_TOKENS,
+    db_path=MEMORY_DB_PATH or None,
+)
 
 
 @dataclass
@@ -54,7 +104,7 @@ class RagHit:
     id: str
     text: str
     source: str
-    distance: float
+    distance: Optional[float]  # None si solo lo encontró BM25
 
 
 @dataclass
@@ -62,43 +112,156 @@ class RagResult:
     question: str
     hits: List[RagHit]
     context: str
+    # Tokens usados por sección, presupuesto y fragmentos descartados
+    context_report: Dict[str, Any] = field(default_factory=dict)
+    # Hits tal como los entrega bd.chroma_store (id/text/metadata/distance)
+    raw_hits: List[Dict[str, Any]] = field(default_factory=list)
 
 
 def _has_openai_key() -> bool:
-    key = getattr(config, "gpt_key", None) or os.getenv("OPENAI_API_KEY")
+    key = api_key()
     return bool(key and str(key).strip())
 
 
-def _build_rag_context(question: str, top_k: int, max_chars_per_doc: int) -> RagResult:
-    raw_hits = chroma_search(question, top_k=top_k)
+@dataclass
+class RagPipeline:
+    """
+    Retrieval + armado de contexto + render del prompt, en un solo lugar.
+    Lo usan generate_text / agenerate_text / astream_text y /rag_debug,
+    así el debug muestra exactamente lo que recibe el LLM.
+    """
+    top_k: int = DEFAULT_TOP_K
+    max_chars_per_doc: Optional[int] = DEFAULT_MAX_CHARS_PER_DOC
+    max_context_tokens: int = DEFAULT_CONTEXT_TOKENS
+    model: str = "gpt-4o-mini"
+    # Filtros de metadata (area, doc_type, source, fechas): ver bd.doc_metadata
+    filters: Optional[Dict[str, Any]] = None
+    # Colección de Chroma (None = la por defecto): ver bd.chroma_store.get_store
+    collection: Optional[str] = None
+
+    def retrieve(self, question: str) -> RagResult:
+        with span("retrieval"):
+            raw_hits = chroma_search(question, top_k=self.top_k, filters=self.filters, collection=self.collection)
+        return self._from_hits(question, raw_hits)
+
+    async def aretrieve(self, question: str) -> RagResult:
+        # Incluye la espera en el executor de retrieval (cola bajo carga)
+        with span("retrieval"):
+            raw_hits = await chroma_asearch(
+                question, top_k=self.top_k, filters=self.filters, collection=self.collection
+            )
+        # El armado del contexto cuenta tokens (CPU): tampoco va en el event loop
+        return await run_retrieval(self._from_hits, question, raw_hits)
+
+    def render(self, question: str, rag: RagResult, history: str = "") -> Dict[str, str]:
+        with span("prompt_render"):
+            return _render_prompt(question, rag.context, history)
+
+    def _from_hits(self, question: str, raw_hits: List[Dict[str, Any]]) -> RagResult:
+        with span("context_build"):
+            return _rag_from_hits(question, raw_hits, self.max_chars_per_doc, self.max_context_tokens, self.model)
+
+
+def _rag_from_hits(
+    question: str,
+    raw_hits: List[Dict[str, Any]],
+    max_chars_per_doc: Optional[int],
+    max_context_tokens: int,
+    model: str,
+) -> RagResult:
+    built = build_context(
+        raw_hits,
+        max_tokens=max_context_tokens,
+        model=model,
+        max_chars_per_doc=max_chars_per_doc,
+    )
+    hits = [RagHit(id=s.id, text=s.text, source=s.source, distance=s.distance) for s in built.sections]
+    return RagResult(
+        question=question, hits=hits, context=built.context,
+        context_report=built.report(), raw_hits=raw_hits,
+    )
 
-    hits: List[RagHit] = []
-    context_parts: List[str] = []
 
-    for h in raw_hits:
-        meta = h.get("metadata") or {}
-        src = meta.get("source", "") or meta.get("src", "") or "unknown"
-        txt = (h.get("text") or "")[:max_chars_per_doc]
-        dist = h.get("distance", 0.0)
-        _id = h.get("id", "")
+def _prompt_tokens(prompt_rendered: Dict[str, str], rag: RagResult, history: str, model: str) -> Dict[str, int]:
+    """
+    Tokens por sección del prompt final (para controlar costo/latencia).
+    """
+    system = count_tokens(prompt_rendered.get("system", ""), model)
+    user = count_tokens(prompt_rendered.get("user", ""), model)
+    return {
+        "system": system,
+        "history": count_tokens(history, model),
+        "context": rag.context_report.get("tokens_used", 0),
+        "question": count_tokens(rag.question, model),
+        "user_total": user,
+        "total": system + user,
+    }
 
-        hits.append(RagHit(id=_id, text=txt, source=src, distance=float(dist)))
 
-        context_parts.append(
-            f"[source: {src} | id={_id} | distance={float(dist):.4f}]\n{txt}"
-        )
+def _answer_cache_key(rag: RagResult, model: str) -> Tuple:
+    """
+    Ids de los hits + hash del contexto + versión del template + modelo: si
+    cambia lo recuperado (o su texto), la respuesta cacheada no aplica. El
+    historial no entra: las preguntas que dependen de él no usan la caché
+    (ver _is_follow_up).
+    """
+    digest = hashlib.sha1(rag.context.encode("utf-8")).hexdigest()
+    return (tuple(h.id for h in rag.hits), digest, PROMPT_TEMPLATE_VERSION, model)
+
+
+def _is_follow_up(question: str, history: str) -> bool:
+    """
+    True si hay historial y la pregunta parece referirse a él.
+    """
+    return bool(history) and bool(_FOLLOW_UP_RE.search(question.lstrip("¿¡ ")))
+
+
+def _history_for(chat_id: Any) -> str:
+    if chat_id is None or chat_id == "":
+        return ""
+    return _memory.get(chat_id).render()
+
+
+def _remember(chat_id: Any, question: str, answer: str) -> None:
+    if chat_id is None or chat_id == "":
+        return
+    _memory.append(chat_id, question, answer)
+
+
+# Variantes async: con MEMORY_DB_PATH leen/escriben SQLite y compactar cuenta
+# tokens, así que corren en el executor de retrieval (no en el event loop)
+async def _ahistory_for(chat_id: Any) -> str:
+    if chat_id is None or chat_id == "":
+        return ""
+    return await run_retrieval(_history_for, chat_id)
+
+
+async def _aremember(chat_id: Any, question: str, answer: str) -> None:
+    if chat_id is None or chat_id == "":
+        return
+    await run_retrieval(_remember, chat_id, question, answer)
+
+
+def forget_chat(chat_id: Any) -> None:
+    _memory.clear(chat_id)
+
+
+def memory_stats() -> Dict[str, Any]:
+    return _memory.stats()
 
-    context = "\n\n---\n\n".join(context_parts)
 
-    return RagResult(question=question, hits=hits, context=context)
+def answer_cache_stats() -> Dict[str, Any]:
+    return _answer_cache.stats()
 
 
-def _render_prompt(question: str, context: str) -> Dict[str, str]:
+def _render_prompt(question: str, context: str, history: str = "") -> Dict[str, str]:
     """
     Retorna el template ya renderizado (para debug y transparencia).
     """
     system = SYSTEM_PROMPT_ES
     user = USER_TEMPLATE_ES.format(question=question, context=context)
+    if history:
+        user = HISTORY_TEMPLATE_ES.format(history=history) + user
     return {"system": system, "user": user}
 
 
@@ -125,12 +288,18 @@ def _answer_without_llm(rag: RagResult, prompt_rendered: Dict[str, str]) -> str:
         lines.append("- (sin resultados) La base vectorial no retornó documentos para esta consulta.")
     else:
         for i, h in enumerate(rag.hits, 1):
-            lines.append(f"{i}. source={h.source} | id={h.id} | distance={h.distance:.4f}")
+            lines.append(f"{i}. source={h.source} | id={h.id} | distance={format_distance(h.distance)}")
 
     lines.append("\n### Tamaño del prompt (aprox)")
     lines.append(f"- SYSTEM chars: {system_chars}")
     lines.append(f"- USER chars:   {user_chars}")
     lines.append(f"- TOTAL chars:  {total_chars}")
+    report = rag.context_report
+    if report:
+        lines.append(f"- CONTEXTO tokens: {report.get('tokens_used')} / {report.get('budget')} ({report.get('model')})")
+        for sec in report.get("sections", []):
+            flags = " (truncado)" if sec.get("truncated") else ""
+            lines.append(f"  - {sec.get('id')}: {sec.get('tokens')} tokens{flags}")
 
     lines.append("\n### Prompt final que se enviaría al LLM")
     lines.append("#### SYSTEM")
@@ -151,22 +320,115 @@ def _answer_with_llm(prompt_rendered: Dict[str, str], model: str = "gpt-4o-mini"
     """
     Modo CON LLM: llama a OpenAI con el prompt armado.
     """
-    if OpenAI is None:
-        raise RuntimeError("OpenAI SDK no está disponible. Instala 'openai' en el venv.")
+    client = get_client()
+
+    with span("llm"):
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": prompt_rendered["system"]},
+                {"role": "user", "content": prompt_rendered["user"]},
+            ],
+            temperature=0.2,
+        )
+
+    return resp.choices[0].message.content
 
-    key = getattr(config, "gpt_key", None) or os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=key)
 
-    resp = client.chat.completions.create(
+async def _answer_with_llm_async(prompt_rendered: Dict[str, str], model: str = "gpt-4o-mini") -> str:
+    """
+    Igual que _answer_with_llm, pero sin bloquear el event loop.
+    """
+    client = get_async_client()
+
+    with span("llm"):
+        resp = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": prompt_rendered["system"]},
+                {"role": "user", "content": prompt_rendered["user"]},
+            ],
+            temperature=0.2,
+        )
+
+    return resp.choices[0].message.content
+
+
+async def _astream_llm(prompt_rendered: Dict[str, str], model: str = "gpt-4o-mini") -> AsyncIterator[str]:
+    """
+    Modo CON LLM en streaming: entrega los tokens a medida que llegan.
+    """
+    client = get_async_client()
+
+    stream = await client.chat.completions.create(
         model=model,
         messages=[
             {"role": "system", "content": prompt_rendered["system"]},
             {"role": "user", "content": prompt_rendered["user"]},
         ],
         temperature=0.2,
+        stream=True,
     )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
 
-    return resp.choices[0].message.content
+
+def _clean_question(prompt: str) -> str:
+    # Limpieza simple: si viene "pregunta: X", nos quedamos con X
+    question = prompt.strip()
+    if question.lower().startswith("pregunta:"):
+        question = question.split(":", 1)[1].strip()
+    return question
+
+
+def _build_output(
+    *,
+    answer: str,
+    mode: str,
+    chat_id: str,
+    question: str,
+    rag: RagResult,
+    prompt_rendered: Dict[str, str],
+    history: str,
+    top_k: int,
+    max_chars_per_doc: Optional[int],
+    max_context_tokens: int,
+    model: Optional[str],
+    elapsed: float,
+    debug: bool,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None,
+) -> Any:
+    if not debug:
+        return answer
+
+    # Debug payload bien claro para UI/curso
+    return {
+        "mode": mode,
+        "chat_id": chat_id,
+        "question": question,
+        "top_k": top_k,
+        "filters": filters,
+        "collection": collection,
+        "max_chars_per_doc": max_chars_per_doc,
+        "max_context_tokens": max_context_tokens,
+        "model": model,
+        "latency_s": round(elapsed, 3),
+        "hits": [
+            {"id": h.id, "source": h.source, "distance": h.distance, "text_preview": h.text[:300]}
+            for h in rag.hits
+        ],
+        "context": rag.context,
+        "context_tokens": rag.context_report,
+        "prompt_tokens": _prompt_tokens(prompt_rendered, rag, history, model or "gpt-4o-mini"),
+        "history": history,
+        "prompt": prompt_rendered,
+        "answer": answer,
+    }
 
 
 def generate_text(
@@ -175,9 +437,13 @@ def generate_text(
     *,
     use_llm: Optional[bool] = None,
     top_k: int = DEFAULT_TOP_K,
-    max_chars_per_doc: int = DEFAULT_MAX_CHARS_PER_DOC,
+    max_chars_per_doc: Optional[int] = DEFAULT_MAX_CHARS_PER_DOC,
+    max_context_tokens: int = DEFAULT_CONTEXT_TOKENS,
     model: str = "gpt-4o-mini",
     debug: bool = False,
+    use_cache: bool = True,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None,
 ) -> Any:
     """
     Función principal para tu endpoint /messages.
@@ -191,16 +457,18 @@ def generate_text(
     - debug:
         - False => retorna solo string
         - True  => retorna dict con respuesta + debug (hits/context/prompt/latencias)
+    - use_cache: False => no usa la caché semántica de respuestas (fuerza LLM)
+    - filters: restringe el retrieval por metadata, ej. {"area": "flotacion"}
+    - collection: colección donde buscar (None => la por defecto)
     """
     t0 = time.time()
 
-    # Limpieza simple: si viene "pregunta: X", nos quedamos con X
-    question = prompt.strip()
-    if question.lower().startswith("pregunta:"):
-        question = question.split(":", 1)[1].strip()
+    question = _clean_question(prompt)
 
-    rag = _build_rag_context(question, top_k=top_k, max_chars_per_doc=max_chars_per_doc)
-    prompt_rendered = _render_prompt(question, rag.context)
+    pipeline = RagPipeline(top_k, max_chars_per_doc, max_context_tokens, model, filters, collection)
+    rag = pipeline.retrieve(question)
+    history = _history_for(chat_id)
+    prompt_rendered = pipeline.render(question, rag, history)
 
     # Decide modo
     if use_llm is None:
@@ -213,28 +481,184 @@ def generate_text(
         mode = "no_llm"
         answer = _answer_without_llm(rag, prompt_rendered)
     else:
-        mode = "llm"
-        answer = _answer_with_llm(prompt_rendered, model=model)
+        use_cache = use_cache and not _is_follow_up(question, history)
+        cache_key = _answer_cache_key(rag, model)
+        # Sale de la caché de embeddings si el retrieval embebió la pregunta;
+        # en modo keyword (o consultas cortas en hybrid) se embebe aquí
+        qvec = embed_query(question) if use_cache else None
+        cached = _answer_cache.get(cache_key, qvec) if use_cache else None
+        if cached is not None:
+            mode = "llm_cache"
+            answer = cached
+        else:
+            mode = "llm"
+            answer = _answer_with_llm(prompt_rendered, model=model)
+            if use_cache:
+                _answer_cache.put(cache_key, qvec, answer)
+        _remember(chat_id, question, answer)
+
+    return _build_output(
+        answer=answer, mode=mode, chat_id=chat_id, question=question, rag=rag,
+        prompt_rendered=prompt_rendered, history=history, top_k=top_k,
+        max_chars_per_doc=max_chars_per_doc, max_context_tokens=max_context_tokens,
+        model=model if use_llm else None, elapsed=time.time() - t0, debug=debug, filters=filters,
+        collection=collection,
+    )
 
-    elapsed = time.time() - t0
 
-    if not debug:
-        return answer
+async def agenerate_text(
+    prompt: str,
+    chat_id: str,
+    *,
+    use_llm: Optional[bool] = None,
+    top_k: int = DEFAULT_TOP_K,
+    max_chars_per_doc: Optional[int] = DEFAULT_MAX_CHARS_PER_DOC,
+    max_context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    model: str = "gpt-4o-mini",
+    debug: bool = False,
+    use_cache: bool = True,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None,
+) -> Any:
+    """
+    Versión async de generate_text (mismos parámetros y retorno).
+    Retrieval corre en el executor dedicado de bd.chroma_store y la llamada
+    al LLM usa AsyncOpenAI, así un worker mantiene muchas llamadas en vuelo.
+    """
+    t0 = time.time()
 
-    # Debug payload bien claro para UI/curso
-    return {
+    question = _clean_question(prompt)
+
+    pipeline = RagPipeline(top_k, max_chars_per_doc, max_context_tokens, model, filters, collection)
+    rag = await pipeline.aretrieve(question)
+    history = await _ahistory_for(chat_id)
+    prompt_rendered = pipeline.render(question, rag, history)
+
+    if use_llm is None:
+        use_llm = _has_openai_key()
+
+    if not use_llm:
+        mode = "no_llm"
+        answer = _answer_without_llm(rag, prompt_rendered)
+    else:
+        use_cache = use_cache and not _is_follow_up(question, history)
+        cache_key = _answer_cache_key(rag, model)
+        # Ver generate_text: puede costar un forward si el retrieval no embebió
+        qvec = await aembed_query(question) if use_cache else None
+        cached = _answer_cache.get(cache_key, qvec) if use_cache else None
+        if cached is not None:
+            mode = "llm_cache"
+            answer = cached
+        else:
+            mode = "llm"
+            answer = await _answer_with_llm_async(prompt_rendered, model=model)
+            if use_cache:
+                _answer_cache.put(cache_key, qvec, answer)
+        await _aremember(chat_id, question, answer)
+
+    output = partial(
+        _build_output,
+        answer=answer, mode=mode, chat_id=chat_id, question=question, rag=rag,
+        prompt_rendered=prompt_rendered, history=history, top_k=top_k,
+        max_chars_per_doc=max_chars_per_doc, max_context_tokens=max_context_tokens,
+        model=model if use_llm else None, elapsed=time.time() - t0, debug=debug, filters=filters,
+        collection=collection,
+    )
+    # Con debug cuenta los tokens del prompt (CPU)
+    return await run_retrieval(output) if debug else output()
+
+
+async def astream_text(
+    prompt: str,
+    chat_id: str,
+    *,
+    use_llm: Optional[bool] = None,
+    top_k: int = DEFAULT_TOP_K,
+    max_chars_per_doc: Optional[int] = DEFAULT_MAX_CHARS_PER_DOC,
+    max_context_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    model: str = "gpt-4o-mini",
+    use_cache: bool = True,
+    debug: bool = False,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Variante en streaming de agenerate_text. Produce eventos:
+    - {"event": "retrieval", "data": {mode, question, hits...}}  (primero;
+      con debug=True incluye además raw_hits/context/context_tokens/prompt)
+    - {"event": "token", "data": {"delta": "..."}}               (n veces)
+    - {"event": "done", "data": {latency_s, ttft_s}}
+    """
+    t0 = time.time()
+
+    question = _clean_question(prompt)
+
+    pipeline = RagPipeline(top_k, max_chars_per_doc, max_context_tokens, model, filters, collection)
+    rag = await pipeline.aretrieve(question)
+    history = await _ahistory_for(chat_id)
+    prompt_rendered = pipeline.render(question, rag, history)
+
+    if use_llm is None:
+        use_llm = _has_openai_key()
+    mode = "llm" if use_llm else "no_llm"
+
+    cached: Optional[str] = None
+    use_cache = use_cache and not _is_follow_up(question, history)
+    if use_llm and use_cache:
+        cache_key = _answer_cache_key(rag, model)
+        # Ver generate_text: puede costar un forward si el retrieval no embebió
+        qvec = await aembed_query(question)
+        cached = _answer_cache.get(cache_key, qvec)
+        if cached is not None:
+            mode = "llm_cache"
+
+    retrieval: Dict[str, Any] = {
         "mode": mode,
         "chat_id": chat_id,
         "question": question,
         "top_k": top_k,
-        "max_chars_per_doc": max_chars_per_doc,
+        "filters": filters,
+        "collection": collection,
         "model": model if use_llm else None,
-        "latency_s": round(elapsed, 3),
-        "hits": [
-            {"id": h.id, "source": h.source, "distance": h.distance, "text_preview": h.text[:300]}
-            for h in rag.hits
-        ],
-        "context": rag.context,
-        "prompt": prompt_rendered,
-        "answer": answer,
+        "hits": [{"id": h.id, "source": h.source, "distance": h.distance} for h in rag.hits],
+    }
+    if debug:
+        retrieval.update({
+            "raw_hits": rag.raw_hits,
+            "context": rag.context,
+            "context_tokens": rag.context_report,
+            "history": history,
+            "prompt": prompt_rendered,
+        })
+    yield {"event": "retrieval", "data": retrieval}
+
+    ttft: Optional[float] = None
+    if not use_llm:
+        ttft = time.time() - t0
+        yield {"event": "token", "data": {"delta": _answer_without_llm(rag, prompt_rendered)}}
+    elif cached is not None:
+        ttft = time.time() - t0
+        yield {"event": "token", "data": {"delta": cached}}
+        await _aremember(chat_id, question, cached)
+    else:
+        parts: List[str] = []
+        t_llm = time.perf_counter()
+        async for delta in _astream_llm(prompt_rendered, model=model):
+            if ttft is None:
+                ttft = time.time() - t0
+                STAGE_SECONDS.observe(time.perf_counter() - t_llm, stage="llm_ttft")
+            parts.append(delta)
+            yield {"event": "token", "data": {"delta": delta}}
+        STAGE_SECONDS.observe(time.perf_counter() - t_llm, stage="llm")
+        answer = "".join(parts)
+        if use_cache:
+            _answer_cache.put(cache_key, qvec, answer)
+        await _aremember(chat_id, question, answer)
+
+    yield {
+        "event": "done",
+        "data": {
+            "latency_s": round(time.time() - t0, 3),
+            "ttft_s": round(ttft, 3) if ttft is not None else None,
+        },
     }
@@ -0,0 +1,208 @@
+# ai/context.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import os
+
+from ai.tokens import count_tokens, truncate_tokens
+
+
+# -----------------------------
+# Configuración
+# -----------------------------
+# Presupuesto de tokens para el CONTEXTO (fragmentos) dentro del prompt
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# Bajo este saldo no vale la pena meter un fragmento truncado
+MIN_SECTION_TOKENS = 48
+# Un fragmento que, tras quitar el solape, conserva menos de esto se descarta
+MIN_KEEP_FRACTION = 0.2
+
+SEPARATOR = "\n\n---\n\n"
+
+
+@dataclass
+class ContextSection:
+    id: str
+    source: str
+    # None: hit encontrado solo por BM25 (sin distancia vectorial)
+    distance: Optional[float]
+    text: str
+    tokens: int
+    truncated: bool = False
+    trimmed_overlap: bool = False
+    score: Optional[float] = None
+
+
+@dataclass
+class BuiltContext:
+    context: str
+    sections: List[ContextSection]
+    tokens_used: int
+    budget: int
+    model: str
+    # id -> motivo ("duplicate", "overlap", "budget")
+    dropped: Dict[str, str] = field(default_factory=dict)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "budget": self.budget,
+            "tokens_used": self.tokens_used,
+            "sections": [
+                {
+                    "id": s.id,
+                    "source": s.source,
+                    "tokens": s.tokens,
+                    "truncated": s.truncated,
+                    "trimmed_overlap": s.trimmed_overlap,
+                }
+                for s in self.sections
+            ],
+            "dropped": self.dropped,
+        }
+
+
+def format_distance(dist: Optional[float]) -> str:
+    return f"{dist:.4f}" if dist is not None else "n/a"
+
+
+def _header(src: str, _id: str, dist: Optional[float], score: Optional[float] = None) -> str:
+    if dist is None and score is not None:
+        # Solo BM25: no hay distancia; se muestra el puntaje de fusión (RRF)
+        return f"[source: {src} | id={_id} | distance=n/a | score={score:.4f}]\n"
+    return f"[source: {src} | id={_id} | distance={format_distance(dist)}]\n"
+
+
+def _span(meta: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+    try:
+        return (str(meta["parent_id"]), int(meta["char_start"]), int(meta["char_end"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _remove_overlap(text: str, span: Tuple[str, int, int], taken: List[Tuple[str, int, int]]) -> Tuple[str, bool]:
+    """
+    Quita de `text` la parte ya cubierta por fragmentos elegidos del mismo
+    archivo (usa los offsets guardados en la ingesta). Se queda con el
+    segmento no cubierto más largo.
+    """
+    parent, start, end = span
+    segments = [(start, end)]
+    for p, a, b in taken:
+        if p != parent:
+            continue
+        nxt = []
+        for s, e in segments:
+            if b <= s or a >= e:
+                nxt.append((s, e))
+                continue
+            if s < a:
+                nxt.append((s, a))
+            if b < e:
+                nxt.append((b, e))
+        segments = nxt
+    if segments == [(start, end)]:
+        return text, False
+    if not segments:
+        return "", True
+    s, e = max(segments, key=lambda seg: seg[1] - seg[0])
+    return text[s - start:e - start].strip(), True
+
+
+def _by_relevance(raw_hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for score in ("rerank_score", "score"):
+        if raw_hits and all(h.get(score) is not None for h in raw_hits):
+            return sorted(raw_hits, key=lambda h: -float(h[score]))
+    # Sin distancia (solo BM25) -> al final
+    return sorted(raw_hits, key=lambda h: float("inf") if h.get("distance") is None else float(h["distance"]))
+
+
+def build_context(
+    raw_hits: List[Dict[str, Any]],
+    *,
+    max_tokens: int = DEFAULT_CONTEXT_TOKENS,
+    model: str = "gpt-4o-mini",
+    max_chars_per_doc: Optional[int] = None,
+) -> BuiltContext:
+    """
+    Arma el CONTEXTO llenando `max_tokens` (tokens reales de `model`) de
+    forma greedy por relevancia (menor distancia primero, o mayor puntaje
+    si los hits vienen reordenados o de una búsqueda híbrida), sin repetir
+    fragmentos ni trozos solapados del mismo archivo.
+    """
+    hits = _by_relevance(raw_hits)
+
+    sections: List[ContextSection] = []
+    parts: List[str] = []
+    dropped: Dict[str, str] = {}
+    seen_texts = set()
+    taken_spans: List[Tuple[str, int, int]] = []
+    used = 0
+
+    for h in hits:
+        meta = h.get("metadata") or {}
+        src = meta.get("source", "") or meta.get("src", "") or "unknown"
+        _id = h.get("id", "")
+        dist = float(h["distance"]) if h.get("distance") is not None else None
+        score = float(h["score"]) if h.get("score") is not None else None
+        txt = h.get("text") or ""
+        if max_chars_per_doc:
+            txt = txt[:max_chars_per_doc]
+
+        key = " ".join(txt.split())
+        if key in seen_texts:
+            dropped[_id] = "duplicate"
+            continue
+
+        trimmed = False
+        span = _span(meta)
+        if span is not None:
+            new_txt, trimmed = _remove_overlap(txt, span, taken_spans)
+            if len(new_txt) < MIN_KEEP_FRACTION * len(txt):
+                dropped[_id] = "overlap"
+                continue
+            txt = new_txt
+
+        sep_tokens = count_tokens(SEPARATOR, model) if parts else 0
+        header = _header(src, _id, dist, score)
+        fixed = sep_tokens + count_tokens(header, model)
+        body_tokens = count_tokens(txt, model)
+        remaining = max_tokens - used
+
+        truncated = False
+        if fixed + body_tokens > remaining:
+            # Greedy: el más relevante que no cabe entra truncado si queda saldo útil
+            if remaining - fixed < MIN_SECTION_TOKENS:
+                dropped[_id] = "budget"
+                break
+            txt = truncate_tokens(txt, remaining - fixed, model)
+            body_tokens = count_tokens(txt, model)
+            truncated = True
+
+        seen_texts.add(key)
+        if span is not None:
+            taken_spans.append(span)
+        parts.append(header + txt)
+        used += fixed + body_tokens
+        sections.append(ContextSection(
+            id=_id, source=src, distance=dist, score=score, text=txt,
+            tokens=fixed + body_tokens, truncated=truncated, trimmed_overlap=trimmed,
+        ))
+        if truncated:
+            break
+
+    # Lo que quedó fuera por haber agotado el presupuesto
+    for h in hits:
+        _id = h.get("id", "")
+        if _id not in dropped and all(s.id != _id for s in sections):
+            dropped[_id] = "budget"
+
+    return BuiltContext(
+        context=SEPARATOR.join(parts),
+        sections=sections,
+        tokens_used=used,
+        budget=max_tokens,
+        model=model,
+        dropped=dropped,
+    )
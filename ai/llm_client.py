@@ -0,0 +1,108 @@
+# ai/llm_client.py
+from __future__ import annotations
+
+from typing import Optional
+import os
+import threading
+
+import config
+
+# OpenAI (opcional)
+try:
+    from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+    import httpx
+except Exception:
+    OpenAI = None
+    AsyncOpenAI = None
+
+
+# -----------------------------
+# Configuración del cliente LLM
+# -----------------------------
+# OPENAI_BASE_URL permite apuntar a un servidor compatible local (ej. para pruebas).
+LLM_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+# Reintentos con backoff exponencial (los hace el SDK: 429, 5xx, errores de conexión)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY_S = float(os.getenv("LLM_KEEPALIVE_EXPIRY_S", "30"))
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+
+
+def api_key() -> Optional[str]:
+    return getattr(config, "gpt_key", None) or os.getenv("OPENAI_API_KEY")
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_S,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S)
+
+
+def _require_sdk() -> None:
+    if OpenAI is None:
+        raise RuntimeError("OpenAI SDK no está disponible. Instala 'openai' en el venv.")
+
+
+def get_client():
+    """
+    Cliente OpenAI síncrono, único por proceso: reutiliza el pool de
+    conexiones (keep-alive) en vez de abrir un socket + TLS por pregunta.
+    """
+    global _client
+    if _client is None:
+        _require_sdk()
+        with _lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=api_key(),
+                    base_url=LLM_BASE_URL,
+                    timeout=_timeout(),
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+                )
+    return _client
+
+
+def get_async_client():
+    """
+    Cliente AsyncOpenAI único por proceso (ligado al event loop de uvicorn).
+    """
+    global _async_client
+    if _async_client is None:
+        _require_sdk()
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(
+                    api_key=api_key(),
+                    base_url=LLM_BASE_URL,
+                    timeout=_timeout(),
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+                )
+    return _async_client
+
+
+async def aclose_clients() -> None:
+    """
+    Cierra los pools de conexiones (al apagar la app).
+    """
+    global _client, _async_client
+    with _lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
@@ -0,0 +1,173 @@
+# ai/memory.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from ai.tokens import count_tokens, truncate_tokens
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+
+
+@dataclass
+class Conversation:
+    # Resumen compacto de los turnos que ya salieron de la ventana
+    summary: str = ""
+    # Últimos turnos completos (ventana acotada por tokens)
+    turns: List[Turn] = field(default_factory=list)
+
+    def render(self) -> str:
+        """
+        Historial listo para insertar en el prompt ("" si no hay nada).
+        """
+        parts = []
+        if self.summary:
+            parts.append("Resumen de turnos anteriores:\n" + self.summary)
+        for t in self.turns:
+            parts.append(f"Usuario: {t.question}\nAsistente: {t.answer}")
+        return "\n\n".join(parts)
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    m = re.search(r"[.!?](\s|$)", text)
+    if m:
+        text = text[: m.start() + 1]
+    return text if len(text) <= max_chars else text[: max_chars - 1] + "…"
+
+
+class ConversationStore:
+    """
+    Memoria de conversación por chat_id.
+
+    - En memoria: LRU de a lo más `max_chats` conversaciones.
+    - Opcional: respaldo en SQLite (`db_path`), para sobrevivir reinicios y
+      recuperar conversaciones desalojadas del LRU.
+    - Cada conversación guarda una ventana de turnos completos de a lo más
+      `window_tokens`; los turnos que salen de la ventana se comprimen
+      (primera oración de pregunta y respuesta) en un resumen de a lo más
+      `summary_tokens`. El prompt nunca crece sin límite.
+    """
+
+    def __init__(
+        self,
+        max_chats: int = 1000,
+        window_tokens: int = 1000,
+        summary_tokens: int = 300,
+        db_path: Optional[str] = None,
+        model: str = "gpt-4o-mini",
+    ):
+        self.max_chats = max_chats
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.model = model
+        self._chats: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " chat_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, chat_id: Any) -> Conversation:
+        key = str(chat_id)
+        with self._lock:
+            conv = self._chats.get(key)
+            if conv is None:
+                conv = self._load(key) or Conversation()
+                self._chats[key] = conv
+                self._trim_lru()
+            self._chats.move_to_end(key)
+            # Copia: quien llama no debe mutar el estado compartido
+            return Conversation(summary=conv.summary, turns=list(conv.turns))
+
+    def append(self, chat_id: Any, question: str, answer: str) -> None:
+        key = str(chat_id)
+        with self._lock:
+            conv = self._chats.get(key) or self._load(key) or Conversation()
+            conv.turns.append(Turn(question=question, answer=answer))
+            self._compact(conv)
+            self._chats[key] = conv
+            self._chats.move_to_end(key)
+            self._trim_lru()
+            self._save(key, conv)
+
+    def clear(self, chat_id: Any) -> None:
+        key = str(chat_id)
+        with self._lock:
+            self._chats.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM conversations WHERE chat_id = ?", (key,))
+                self._db.commit()
+
+    def _turn_tokens(self, t: Turn) -> int:
+        return count_tokens(t.question, self.model) + count_tokens(t.answer, self.model)
+
+    def _compact(self, conv: Conversation) -> None:
+        # Siempre se conserva al menos el último turno completo
+        while len(conv.turns) > 1 and sum(self._turn_tokens(t) for t in conv.turns) > self.window_tokens:
+            old = conv.turns.pop(0)
+            line = f"- P: {_first_sentence(old.question, 200)} | R: {_first_sentence(old.answer, 240)}"
+            conv.summary = f"{conv.summary}\n{line}".strip()
+
+        # El resumen también está acotado: se descartan las líneas más antiguas
+        lines = conv.summary.splitlines()
+        while len(lines) > 1 and count_tokens("\n".join(lines), self.model) > self.summary_tokens:
+            lines.pop(0)
+        conv.summary = truncate_tokens("\n".join(lines), self.summary_tokens, self.model)
+
+        # Un único turno gigante: se recorta la respuesta
+        if conv.turns and self._turn_tokens(conv.turns[-1]) > self.window_tokens:
+            t = conv.turns[-1]
+            budget = max(self.window_tokens - count_tokens(t.question, self.model), 0)
+            conv.turns[-1] = Turn(question=t.question, answer=truncate_tokens(t.answer, budget, self.model))
+
+    def _trim_lru(self) -> None:
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Conversation]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT data FROM conversations WHERE chat_id = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        return Conversation(
+            summary=data.get("summary", ""),
+            turns=[Turn(**t) for t in data.get("turns", [])],
+        )
+
+    def _save(self, key: str, conv: Conversation) -> None:
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO conversations (chat_id, data, updated_at) VALUES (?, ?, ?)",
+            (key, json.dumps(asdict(conv), ensure_ascii=False), time.time()),
+        )
+        self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chats_in_memory": len(self._chats),
+            "max_chats": self.max_chats,
+            "window_tokens": self.window_tokens,
+            "summary_tokens": self.summary_tokens,
+            "sqlite": self._db is not None,
+        }
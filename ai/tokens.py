@@ -0,0 +1,92 @@
+# ai/tokens.py
+from __future__ import annotations
+
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+import argparse
+import os
+
+# tiktoken descarga cada encoding (ej. o200k_base) la primera vez que se usa
+# y lo guarda en TIKTOKEN_CACHE_DIR. Por defecto tiktoken usa un directorio
+# temporal que se pierde al reiniciar el contenedor; aquí queda al lado del
+# proyecto. Sin red y sin el archivo en caché se usa la estimación.
+# Precargar por adelantado (ej. en el build de la imagen):
+#   python -m ai.tokens --model gpt-4o-mini
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR") or str(Path(__file__).resolve().parents[1] / "tiktoken_cache")
+os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+
+# tiktoken (opcional): si no está, se usa una aproximación de ~4 chars/token
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """
+    Encoding de `model`, o None (estimación). lru_cache: un fallo de carga
+    (ej. descarga sin red) no se reintenta en cada llamada y se avisa una
+    vez por modelo.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Modelos nuevos que la versión instalada de tiktoken no conoce
+        reason = f"tiktoken {getattr(tiktoken, '__version__', '?')} no conoce {model!r}"
+        for name in ("o200k_base", "cl100k_base"):
+            try:
+                enc = tiktoken.get_encoding(name)
+            except Exception:
+                continue
+            print(f"{reason}: conteo aproximado con {name}")
+            return enc
+    except Exception as e:
+        reason = f"No se pudo cargar el encoding de {model!r} ({type(e).__name__}: {e})"
+    print(f"{reason}: conteo estimado (~4 chars/token). Precargar con: python -m ai.tokens --model {model}")
+    return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Tokens de `text` para `model` (tiktoken real, o estimación si no está).
+    """
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """
+    Recorta `text` a como máximo `max_tokens` tokens.
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _encoding(model)
+    if enc is None:
+        return text[: max_tokens * 4]
+    ids = enc.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return text
+    return enc.decode(ids[:max_tokens])
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Descarga a TIKTOKEN_CACHE_DIR los encodings de tiktoken")
+    ap.add_argument("--model", action="append", default=None, help="Modelo (repetible; por defecto gpt-4o-mini)")
+    args = ap.parse_args(argv)
+    for model in args.model or ["gpt-4o-mini"]:
+        enc = _encoding(model)
+        if enc is None:
+            raise SystemExit(f"No se pudo cargar el encoding de {model!r}")
+        print(f"{model}: {enc.name} en {os.environ['TIKTOKEN_CACHE_DIR']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from array import array
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normaliza una consulta para usarla como clave de caché:
+    NFC, minúsculas y espacios colapsados (se conservan tildes).
+    """
+    return " ".join(unicodedata.normalize("NFC", text or "").lower().split())
+
+
+class LRUCache:
+    """
+    Caché LRU acotada y thread-safe, con contadores de hit/miss.
+    Con `ttl_s`, las entradas expiran tras ese número de segundos.
+    `on_evict(key, value)` se llama (fuera del lock) por cada entrada que
+    sale por falta de espacio.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl_s: Optional[float] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.on_evict = on_evict
+        # key -> (expira_en, valor)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl_s if self.ttl_s else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            evicted = self._trim()
+        self._evicted(evicted)
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        """
+        Retorna el valor vigente de `key` o guarda `value`. Atómico: si dos
+        threads crean el mismo valor a la vez, ambos reciben el mismo.
+        """
+        if self.maxsize <= 0:
+            return value
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[0] is None or item[0] > now):
+                self._data.move_to_end(key)
+                return item[1]
+            self._data[key] = (now + self.ttl_s if self.ttl_s else None, value)
+            self._data.move_to_end(key)
+            evicted = self._trim()
+        self._evicted(evicted)
+        return value
+
+    def _trim(self) -> List[Tuple[Hashable, Any]]:
+        evicted = []
+        while len(self._data) > self.maxsize:
+            key, (_, value) = self._data.popitem(last=False)
+            evicted.append((key, value))
+        return evicted
+
+    def _evicted(self, items: List[Tuple[Hashable, Any]]) -> None:
+        if self.on_evict is None:
+            return
+        for key, value in items:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print("Error liberando entrada de caché", key, e)
+
+    def keys(self) -> List[Hashable]:
+        """
+        Claves, de la menos a la más recientemente usada.
+        """
+        with self._lock:
+            return list(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SqliteEmbeddingCache:
+    """
+    Caché persistente (opcional) de embeddings: (modelo, texto) -> float32[].
+    Sobrevive reinicios y es compartible entre workers del mismo host.
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            " model TEXT NOT NULL, text TEXT NOT NULL, vec BLOB NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+        self._conn.commit()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vec FROM query_embeddings WHERE model = ? AND text = ?", (model, text)
+            ).fetchone()
+        if row is None:
+            return None
+        return array("f", row[0]).tolist()
+
+    def put(self, model: str, text: str, vec: List[float]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, text, vec) VALUES (?, ?, ?)",
+                (model, text, array("f", vec).tobytes()),
+            )
+            self._conn.commit()
@@ -1,77 +1,662 @@
 from __future__ import annotations
 from typing import List, Dict, Any, Optional
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import os
+import re
+import threading
+import time
 
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from sentence_transformers import SentenceTransformer
+from bd.cache import LRUCache, SqliteEmbeddingCache, normalize_query
+from bd.embeddings import EMBEDDING_MODEL, DEFAULT_CONFIG, build_embedding_fn, check_collection_model
+from bd.keyword_index import BM25Index, rrf_fuse
+from bd.rerank import CrossEncoderReranker, RERANK_MODEL, RERANK_CANDIDATES
+from bd.doc_metadata import filters_key, to_chroma_where, to_predicate
+from bd.microbatch import MicroBatcher
+from metrics import span
 
-# Ruta absoluta estable al directorio chroma_db (al lado del proyecto)
-CHROMA_DIR = str((Path(__file__).resolve().parents[1] / "chroma_db").resolve())
+# Ruta absoluta estable al directorio chroma_db (al lado del proyecto).
+# CHROMA_DIR en el entorno permite usar otra (ej. benchmarks en un tmp).
+CHROMA_DIR = os.getenv("CHROMA_DIR") or str((Path(__file__).resolve().parents[1] / "chroma_db").resolve())
 COLLECTION_NAME = "kb_concentradora"
 
-print("CHROMA_DIR =", CHROMA_DIR)
 
-embedding_fn = SentenceTransformerEmbeddingFunction(
-    #model_name="sentence-transformers/all-MiniLM-L6-v2"
-    model_name="BAAI/bge-large-en-v1.5"
-)
+def sidecar_path(filename: str, collection: Optional[str] = None) -> Path:
+    """
+    Archivo auxiliar de una colección, al lado de chroma_db/. La colección
+    por defecto conserva el nombre histórico; las demás llevan sufijo
+    (ej. "bm25_index.sqlite3" -> "bm25_index_<colección>.sqlite3").
+    """
+    path = Path(CHROMA_DIR).with_name(filename)
+    if not collection or collection == COLLECTION_NAME:
+        return path
+    return path.with_name(f"{path.stem}_{collection}{path.suffix}")
+
+
+# Modelo/backend de embeddings: ver bd.embeddings (EMBEDDING_MODEL, EMBEDDING_BACKEND)
+EMBEDDING_KEY = DEFAULT_CONFIG.key
+
+
+# -----------------------------
+# Carga perezosa (lazy) del modelo y del cliente
+# -----------------------------
+# Nada pesado se construye al importar este módulo: el modelo de embeddings
+# (>1 GB en RAM) y el PersistentClient se crean en el primer uso o en warmup().
+_lock = threading.RLock()
+_embedding_fn = None
+_client = None
+
+
+def get_embedding_fn():
+    """
+    Función de embeddings compartida por todo el proceso (se crea una sola vez).
+    """
+    global _embedding_fn
+    if _embedding_fn is None:
+        with _lock:
+            if _embedding_fn is None:
+                _embedding_fn = build_embedding_fn(DEFAULT_CONFIG)
+    return _embedding_fn
+
+
+def get_client():
+    """
+    Cliente persistente de Chroma compartido por todo el proceso.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import chromadb
+
+                # ESTA es la forma persistente recomendada
+                _client = chromadb.PersistentClient(path=CHROMA_DIR)
+    return _client
+
+
+class CollectionNotFound(ValueError):
+    """
+    Se pidió una colección que no existe en CHROMA_DIR (hay que ingerirla).
+    """
+
+
+class ChromaStore:
+    """
+    Handle thread-safe sobre una colección de Chroma, con su índice BM25 y
+    su archivo de versión. La colección se abre en el primer acceso a
+    `.collection` (o con open()); el modelo de embeddings es del proceso.
+
+    La metadata de la colección registra el modelo que la construyó; abrirla
+    con otro EMBEDDING_MODEL lanza EmbeddingModelMismatch.
+    """
+
+    def __init__(self, name: str = COLLECTION_NAME):
+        self.name = name
+        self._collection = None
+        self.embedding_model: Optional[str] = None
+        # Archivo "versión": cualquier upsert/delete (incluida la ingesta en
+        # otro proceso) lo toca, invalidando la caché de resultados.
+        self.version_path = sidecar_path("chroma_version", name)
+        self.keyword_index_path = str(sidecar_path("bm25_index.sqlite3", name))
+        self._local_version = 0
+        self._keyword_index: Optional[BM25Index] = None
+        self._keyword_version: Optional[tuple] = None
+        # Lock propio: recargar el BM25 de una colección no bloquea a las demás
+        # ni la carga del modelo / cliente (que usan el _lock del módulo)
+        self._lock = threading.RLock()
+
+    def open(self, create: bool = True):
+        """
+        Abre la colección; sin `create`, una inexistente lanza CollectionNotFound.
+
+        Se abre SIN función de embeddings (no carga el modelo): los vectores se
+        calculan fuera de Chroma (embed_queries / upsert_docs) y se le pasan ya
+        hechos. Así Chroma no valida nuestra función contra la que registró en
+        la colección (name()/get_config(), que los backends ONNX/int8 no tienen
+        y que cambiaría al cambiar EMBEDDING_BACKEND con el mismo modelo).
+        """
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    if create:
+                        metadata = {"hnsw:space": "cosine", **DEFAULT_CONFIG.collection_metadata()}
+                        col = get_client().get_or_create_collection(
+                            name=self.name,
+                            embedding_function=None,
+                            metadata=metadata
+                        )
+                    else:
+                        try:
+                            col = get_client().get_collection(name=self.name, embedding_function=None)
+                        except Exception as e:
+                            # ValueError o NotFoundError según la versión de chromadb
+                            raise CollectionNotFound(f"No existe la colección {self.name!r}") from e
+                    current = dict(col.metadata or {})
+                    if "embedding_model" not in current and col.count() == 0:
+                        # Colección vacía sin registro: la "adopta" el modelo actual
+                        current.update(DEFAULT_CONFIG.collection_metadata())
+                        try:
+                            # Chroma no permite "cambiar" hnsw:space vía modify
+                            col.modify(metadata={k: v for k, v in current.items() if not k.startswith("hnsw:")})
+                        except Exception as e:
+                            print("No se pudo registrar el modelo en la colección", self.name, e)
+                    self.embedding_model = check_collection_model(current, DEFAULT_CONFIG, self.name)
+                    self._collection = col
+        return self._collection
+
+    @property
+    def collection(self):
+        return self.open()
+
+    @property
+    def ready(self) -> bool:
+        return self._collection is not None
+
+    def warmup(self) -> None:
+        """
+        Carga modelo + colección y hace un forward de prueba,
+        para que la primera consulta real no pague la inicialización.
+        """
+        get_embedding_fn()(["warmup"])
+        _ = self.collection
+
+    def version(self) -> tuple:
+        """
+        (cambios en este proceso, mtime del archivo de versión).
+        Un stat() por consulta: detecta ingestas hechas por otros procesos.
+        """
+        try:
+            mtime = os.stat(self.version_path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        return (self._local_version, mtime)
+
+    def bump_version(self) -> None:
+        with self._lock:
+            self._local_version += 1
+        try:
+            self.version_path.write_text(str(time.time_ns()), encoding="utf-8")
+        except OSError as e:
+            print("No se pudo actualizar", self.version_path, e)
+
+    def keyword_index(self) -> BM25Index:
+        """
+        Índice BM25 de la colección; si otro proceso ingirió (versión), aplica
+        sus cambios de forma incremental (ver BM25Index.reload).
+        """
+        with self._lock:
+            version = self.version()
+            if self._keyword_index is None:
+                self._keyword_index = BM25Index(self.keyword_index_path)
+                self._keyword_version = version
+            elif self._keyword_version != version:
+                self._keyword_index.reload()
+                self._keyword_version = version
+            return self._keyword_index
 
-# ESTA es la forma persistente recomendada
-_client = chromadb.PersistentClient(path=CHROMA_DIR)
+    def keyword_index_changed(self) -> None:
+        # Cambios hechos por este proceso: el índice en memoria ya está al día
+        self.bump_version()
+        with self._lock:
+            self._keyword_version = self.version()
 
-_collection = _client.get_or_create_collection(
-    name=COLLECTION_NAME,
-    embedding_function=embedding_fn,
-    metadata={"hnsw:space": "cosine"}
+    def close(self) -> None:
+        """
+        Libera el índice BM25 en memoria y su conexión SQLite (al salir del
+        registro). Quien aún tenga el store lo vuelve a cargar al usarlo.
+        """
+        with self._lock:
+            index, self._keyword_index = self._keyword_index, None
+            self._keyword_version = None
+        if index is not None:
+            index.close()
+
+
+# -----------------------------
+# Registro de colecciones (varias bases de conocimiento por proceso)
+# -----------------------------
+# Cada request puede elegir `collection` (ej. una por planta). Todas comparten
+# el cliente, la función de embeddings (un solo modelo en RAM) y la caché de
+# embeddings de consulta; cada una tiene su handle, índice BM25 y versión.
+# COLLECTION_NAME queda siempre abierta; las demás se abren bajo demanda y se
+# mantienen hasta COLLECTION_REGISTRY_SIZE a la vez (LRU: al abrir una nueva
+# se suelta la menos usada, que se vuelve a abrir si alguien la pide).
+# Soltarla libera su índice BM25 y su conexión SQLite, pero NO su índice
+# vectorial: el PersistentClient (bindings Rust de chromadb) mantiene cargado
+# el HNSW de toda colección consultada hasta que el proceso termina, y no
+# expone cómo descargarlo (chroma_memory_limit_bytes solo lo lee el backend
+# Python, que PersistentClient no usa). La RAM vectorial crece con la suma de
+# las colecciones consultadas desde el arranque: dimensionar para eso.
+COLLECTION_REGISTRY_SIZE = int(os.getenv("COLLECTION_REGISTRY_SIZE", "8"))
+
+# Reglas de nombres de Chroma (3-63 caracteres)
+_COLLECTION_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{1,61}[A-Za-z0-9]")
+
+_store = ChromaStore()
+_stores = LRUCache(maxsize=COLLECTION_REGISTRY_SIZE, on_evict=lambda name, store: store.close())
+
+
+def get_store(collection: Optional[str] = None, create: bool = False) -> ChromaStore:
+    """
+    Store de `collection` (None = COLLECTION_NAME). Si la colección no existe
+    lanza CollectionNotFound, salvo con `create` (ingesta).
+    """
+    if not collection or collection == COLLECTION_NAME:
+        return _store
+    if not isinstance(collection, str) or not _COLLECTION_NAME_RE.fullmatch(collection):
+        raise ValueError(
+            f"Nombre de colección inválido: {collection!r} (3-63 caracteres: letras, números, '.', '_' o '-')"
+        )
+    store = _stores.get(collection)
+    if store is None:
+        store = ChromaStore(collection)
+        # Se abre antes de registrarla: un nombre inexistente no desplaza a las abiertas
+        store.open(create=create)
+        store = _stores.setdefault(collection, store)
+    return store
+
+
+# -----------------------------
+# Caché de embeddings de consulta
+# -----------------------------
+# Clave: (modelo/backend, consulta normalizada). Una pregunta repetida no vuelve a
+# pasar por el modelo. QUERY_EMB_CACHE_PATH activa además una caché SQLite.
+QUERY_EMB_CACHE_SIZE = int(os.getenv("QUERY_EMB_CACHE_SIZE", "1024"))
+QUERY_EMB_CACHE_PATH = os.getenv("QUERY_EMB_CACHE_PATH", "")
+
+_query_emb_cache = LRUCache(maxsize=QUERY_EMB_CACHE_SIZE)
+_query_emb_disk = SqliteEmbeddingCache(QUERY_EMB_CACHE_PATH) if QUERY_EMB_CACHE_PATH else None
+
+
+def _to_list(vec) -> List[float]:
+    return vec.tolist() if hasattr(vec, "tolist") else [float(x) for x in vec]
+
+
+# Micro-batching de consultas concurrentes (ver bd.microbatch): los textos
+# que no están en caché se encolan y un thread los embebe juntos, hasta
+# EMBED_BATCH_MAX_SIZE por forward pass, esperando a lo más EMBED_BATCH_WAIT_MS
+# a que lleguen otros. Los llamadores concurrentes están acotados por
+# RETRIEVAL_WORKERS (más /search/batch). EMBED_BATCH_MAX_SIZE=0 lo desactiva.
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "2"))
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return [_to_list(vec) for vec in get_embedding_fn()(texts)]
+
+
+_embed_batcher = (
+    MicroBatcher(_embed_batch, max_batch_size=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_WAIT_MS)
+    if EMBED_BATCH_MAX_SIZE > 0 else None
 )
 
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embeddings de varias consultas: las que no están en caché se embeben
+    juntas (y junto con las de otros requests concurrentes, vía micro-batching).
+    """
+    # Sin span: "normalize" se mide una vez por consulta, en search_many
+    texts = [normalize_query(q) for q in queries]
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    missing: Dict[str, List[int]] = {}
+
+    for i, text in enumerate(texts):
+        emb = _query_emb_cache.get((EMBEDDING_KEY, text))
+        if emb is None and _query_emb_disk is not None:
+            emb = _query_emb_disk.get(EMBEDDING_KEY, text)
+            if emb is not None:
+                _query_emb_cache.put((EMBEDDING_KEY, text), emb)
+        if emb is None:
+            missing.setdefault(text, []).append(i)
+        else:
+            out[i] = emb
+
+    if missing:
+        batch = list(missing)
+        # Con micro-batching incluye la espera en cola
+        with span("embedding"):
+            vecs = _embed_batcher(batch) if _embed_batcher is not None else _embed_batch(batch)
+        for text, emb in zip(batch, vecs):
+            _query_emb_cache.put((EMBEDDING_KEY, text), emb)
+            if _query_emb_disk is not None:
+                _query_emb_disk.put(EMBEDDING_KEY, text, emb)
+            for i in missing[text]:
+                out[i] = emb
+
+    return out
+
+
+def embed_query(query: str) -> List[float]:
+    return embed_queries([query])[0]
+
+
+# -----------------------------
+# Caché de resultados de search()
+# -----------------------------
+# Clave: (consulta normalizada, top_k, distance_threshold, modo, rerank, filtros, colección, versión de colección).
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "300"))
+
+_result_cache = LRUCache(maxsize=RESULT_CACHE_SIZE, ttl_s=RESULT_CACHE_TTL_S)
+
+
+# -----------------------------
+# Índice léxico BM25 + fusión híbrida
+# -----------------------------
+# Se mantiene en upsert_docs/delete_docs y se persiste al lado de chroma_db/
+# (uno por colección, ver ChromaStore.keyword_index).
+# RETRIEVAL_MODE por defecto: "hybrid" (BM25 + vector, fusión RRF),
+# "vector" (solo Chroma) o "keyword" (solo BM25, sin embedding).
+# En "hybrid", consultas de hasta HYBRID_KEYWORD_ONLY_TOKENS tokens que
+# existen todos en el índice (ej. "SAG", "pH", "TK-301") se responden solo
+# con BM25, sin pasar por el modelo.
+RETRIEVAL_MODES = ("hybrid", "vector", "keyword")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+HYBRID_KEYWORD_ONLY_TOKENS = int(os.getenv("HYBRID_KEYWORD_ONLY_TOKENS", "2"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def rebuild_keyword_index(collection: Optional[str] = None, batch_size: int = 1000) -> int:
+    """
+    Reconstruye el índice BM25 desde la colección (ej. colecciones ingeridas
+    antes de existir el índice). Retorna la cantidad de chunks indexados.
+    """
+    store = get_store(collection)
+    index = store.keyword_index()
+    index.clear()
+    total = store.collection.count()
+    for offset in range(0, total, batch_size):
+        res = store.collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        index.upsert(res["ids"], res["documents"], res["metadatas"] or [{} for _ in res["ids"]])
+    store.keyword_index_changed()
+    return len(index)
+
+
+# Reranking con cross-encoder (opcional, RERANK_MODEL): ver bd.rerank
+_reranker = CrossEncoderReranker(RERANK_MODEL) if RERANK_MODEL else None
+
+
+def cache_stats() -> Dict[str, Any]:
+    stats = {
+        "query_embeddings": _query_emb_cache.stats(),
+        "results": _result_cache.stats(),
+    }
+    if _reranker is not None:
+        stats["rerank_scores"] = _reranker.stats()
+    stats["collections"] = {**_stores.stats(), "open": [COLLECTION_NAME, *_stores.keys()]}
+    return stats
+
+
+def warmup() -> None:
+    _store.warmup()
+
+
+def is_ready() -> bool:
+    return _store.ready
+
+
+def embedding_info(collection: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "model": DEFAULT_CONFIG.model,
+        "backend": DEFAULT_CONFIG.backend,
+        "collection_model": get_store(collection).embedding_model,
+        "microbatch": _embed_batcher.stats() if _embed_batcher is not None else None,
+    }
+
+
 def upsert_docs(
     ids: List[str],
     texts: List[str],
-    metadatas: Optional[List[Dict[str, Any]]] = None
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    embeddings: Optional[List[List[float]]] = None,
+    collection: Optional[str] = None
 ) -> None:
+    """
+    Si se pasan `embeddings` (precomputados, ej. por bd.embed_pool) no se
+    carga el modelo; si no, se calculan aquí (la colección no tiene función
+    de embeddings, ver ChromaStore.open). `collection` se crea si no existe.
+    """
     if metadatas is None:
         metadatas = [{} for _ in ids]
 
-    _collection.upsert(ids=ids, documents=texts, metadatas=metadatas)
+    store = get_store(collection, create=True)
+    if embeddings is None:
+        embeddings = _embed_batch(texts)
+    store.collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+    store.keyword_index().upsert(ids, texts, metadatas)
+    store.keyword_index_changed()
 
     # En algunas versiones, esto asegura flush a disco
     try:
-        _client.persist()
+        get_client().persist()
     except Exception:
         pass
 
+def delete_docs(
+    ids: Optional[List[str]] = None,
+    where: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None
+) -> None:
+    if not ids and not where:
+        return
+    store = get_store(collection, create=True)
+    store.collection.delete(ids=ids or None, where=where)
+    store.keyword_index().delete(ids=ids, where=where)
+    store.keyword_index_changed()
+
 #def search(query: str, top_k: int = 3, *, distance_threshold: float | None = 0.45, min_chars_query: int = 6):
 
-def search(query: str, top_k: int = 3, distance_threshold: float | None = 0.5) -> List[Dict[str, Any]]:
-    res = _collection.query(
-        query_texts=[query],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]
+def search(
+    query: str,
+    top_k: int = 3,
+    distance_threshold: float | None = 0.5,
+    mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Hits [{id, text, metadata, distance}] mejor primero. En modo "hybrid" o
+    "keyword" traen además `score` (RRF) y, si BM25 los encontró, `bm25`;
+    `distance` es None para hits que solo encontró BM25.
+    `distance_threshold` filtra solo los candidatos vectoriales.
+
+    rerank (None = activo si hay RERANK_MODEL): trae RERANK_CANDIDATES
+    candidatos SIN corte por distancia, los reordena con el cross-encoder
+    y retorna los top_k (con `rerank_score`).
+
+    filters (ver bd.doc_metadata.FILTER_KEYS), ej. {"area": "flotacion"} o
+    {"area": ["molienda", "flotacion"], "date_from": "2024-01-01"}: se empujan
+    a la consulta de Chroma (`where`) y al índice BM25, así solo se busca
+    dentro de ese subconjunto.
+
+    collection (None = COLLECTION_NAME): colección donde buscar (ver get_store).
+    """
+    return search_many(
+        [query], top_k=top_k, distance_threshold=distance_threshold, mode=mode, rerank=rerank, filters=filters,
+        collection=collection,
+    )[0]
+
+
+def search_many(
+    queries: List[str],
+    top_k: int = 3,
+    distance_threshold: float | None = 0.5,
+    mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Igual que search() para muchas consultas: los embeddings faltantes se
+    calculan en un solo batch y se hace UNA consulta vectorizada a Chroma.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"mode inválido: {mode!r} (opciones: {', '.join(RETRIEVAL_MODES)})")
+    if rerank is None:
+        rerank = _reranker is not None
+    elif rerank and _reranker is None:
+        raise ValueError("rerank=True requiere configurar RERANK_MODEL")
+    # Valida los filtros antes de tocar cachés o el modelo
+    to_chroma_where(filters)
+    fkey = filters_key(filters)
+    store = get_store(collection)
+    version = store.version()
+    with span("normalize"):
+        keys = [
+            (normalize_query(q), top_k, distance_threshold, mode, rerank, fkey, store.name, version)
+            for q in queries
+        ]
+    results: List[Optional[List[Dict[str, Any]]]] = [_result_cache.get(k) for k in keys]
+
+    todo = [i for i, hits in enumerate(results) if hits is None]
+    if todo:
+        todo_queries = [queries[i] for i in todo]
+        if rerank:
+            candidates = _search_uncached(store, todo_queries, max(top_k, RERANK_CANDIDATES), None, mode, filters)
+            fresh = [_reranker.rerank(q, hits, top_k) for q, hits in zip(todo_queries, candidates)]
+        else:
+            fresh = _search_uncached(store, todo_queries, top_k, distance_threshold, mode, filters)
+        for i, hits in zip(todo, fresh):
+            results[i] = hits
+            _result_cache.put(keys[i], hits)
+
+    # Copia superficial: quien llama puede modificar los dicts sin ensuciar la caché
+    return [[dict(h) for h in hits] for hits in results]
+
+
+def _search_uncached(
+    store: ChromaStore,
+    queries: List[str],
+    top_k: int,
+    distance_threshold: float | None,
+    mode: str,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[List[Dict[str, Any]]]:
+    if mode == "vector":
+        return _vector_search(store, queries, top_k, distance_threshold, filters)
+
+    n_candidates = max(top_k, HYBRID_CANDIDATES)
+    index = store.keyword_index()
+    predicate = to_predicate(filters)
+    with span("bm25"):
+        lexical = [index.search(q, n_candidates, where=predicate) for q in queries]
+    if mode == "keyword":
+        return [rrf_fuse([hits], top_k, k=RRF_K) for hits in lexical]
+
+    # Consultas cortas con todos sus tokens en el índice: sin embedding
+    keyword_only = [
+        len(terms) <= HYBRID_KEYWORD_ONLY_TOKENS and known
+        for terms, known in (index.known_terms(q) for q in queries)
+    ]
+    todo = [i for i, kw in enumerate(keyword_only) if not kw]
+    dense: List[List[Dict[str, Any]]] = [[] for _ in queries]
+    if todo:
+        for i, hits in zip(todo, _vector_search(store, [queries[i] for i in todo], n_candidates, distance_threshold, filters)):
+            dense[i] = hits
+    return [rrf_fuse([dense[i], lexical[i]], top_k, k=RRF_K) for i in range(len(queries))]
+
+
+def _vector_search(
+    store: ChromaStore,
+    queries: List[str],
+    top_k: int,
+    distance_threshold: float | None,
+    filters: Optional[Dict[str, Any]] = None
+) -> List[List[Dict[str, Any]]]:
+    embeddings = embed_queries(queries)
+    with span("chroma_query"):
+        res = store.collection.query(
+            query_embeddings=embeddings,
+            n_results=top_k,
+            where=to_chroma_where(filters),
+            include=["documents", "metadatas", "distances"]
+        )
+
+    all_hits = []
+    for q in range(len(queries)):
+        out = []
+        ids = (res.get("ids") or [[]] * len(queries))[q]
+        docs = (res.get("documents") or [[]] * len(queries))[q]
+        metas = (res.get("metadatas") or [[]] * len(queries))[q]
+        dists = (res.get("distances") or [[]] * len(queries))[q]
+
+        for i in range(len(ids)):
+            dist = float(dists[i])
+            if distance_threshold is not None and dist > distance_threshold:
+                continue
+            out.append({
+                "id": ids[i],
+                "text": docs[i],
+                "metadata": metas[i],
+                "distance": dists[i],
+            })
+        all_hits.append(out)
+    return all_hits
+
+# -----------------------------
+# Variantes async
+# -----------------------------
+# El embedding y la consulta a Chroma son CPU/IO bloqueantes: se ejecutan en
+# un executor dedicado y acotado (RETRIEVAL_WORKERS), separado del threadpool
+# por defecto, para que el event loop siga atendiendo llamadas al LLM.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+
+async def run_retrieval(fn, *args, **kwargs):
+    """
+    Ejecuta `fn` en el executor de retrieval. También lo usa el resto del
+    trabajo bloqueante de un request async (ej. ai.chat: armado del contexto
+    con tiktoken, memoria de conversación en SQLite).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_retrieval_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def asearch(
+    query: str,
+    top_k: int = 3,
+    distance_threshold: float | None = 0.5,
+    mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    return await run_retrieval(
+        search, query, top_k=top_k, distance_threshold=distance_threshold, mode=mode, rerank=rerank, filters=filters,
+        collection=collection,
+    )
+
+
+async def aembed_query(query: str) -> List[float]:
+    return await run_retrieval(embed_query, query)
+
+
+async def asearch_many(
+    queries: List[str],
+    top_k: int = 3,
+    distance_threshold: float | None = 0.5,
+    mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    collection: Optional[str] = None
+) -> List[List[Dict[str, Any]]]:
+    return await run_retrieval(
+        search_many, queries, top_k=top_k, distance_threshold=distance_threshold, mode=mode, rerank=rerank,
+        filters=filters, collection=collection,
     )
 
-    out = []
-    ids = res.get("ids", [[]])[0]
-    docs = res.get("documents", [[]])[0]
-    metas = res.get("metadatas", [[]])[0]
-    dists = res.get("distances", [[]])[0]
-
-    for i in range(len(ids)):
-        dist = float(dists[i])
-        if distance_threshold is not None and dist > distance_threshold:
-            continue
-        out.append({
-            "id": ids[i],
-            "text": docs[i],
-            "metadata": metas[i],
-            "distance": dists[i],
-        })
-    return out
 
-def count() -> int:
-    return _collection.count()
+def count(collection: Optional[str] = None) -> int:
+    return get_store(collection).collection.count()
 
 def debug_collections() -> List[str]:
-    cols = _client.list_collections()
+    cols = get_client().list_collections()
     return [c.name for c in cols]
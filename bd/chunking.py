@@ -0,0 +1,152 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List
+import re
+
+
+# -----------------------------
+# Chunking de documentos
+# -----------------------------
+# Estrategias:
+#   - "chars":     ventanas de ~chunk_size caracteres (corta en espacio), con overlap
+#   - "sentences": agrupa oraciones completas hasta chunk_size, con overlap de oraciones
+#   - "headings":  un chunk por sección (título + párrafos); secciones largas se
+#                  subdividen por oraciones
+STRATEGIES = ("chars", "sentences", "headings")
+
+DEFAULT_STRATEGY = "sentences"
+DEFAULT_CHUNK_SIZE = 800
+DEFAULT_OVERLAP = 120
+
+# Se registra en el manifiesto de ingesta: subirla cuando cambian los cortes
+# para los mismos parámetros, así los archivos ya ingeridos se re-procesan
+CHUNKING_VERSION = 2
+
+# Oración = hasta un [.!?] seguido de espacio/fin (no corta "10.5") o hasta fin de línea
+_SENTENCE_RE = re.compile(r"[^\n]+?(?:[.!?]+(?=\s|$)|$)", re.M)
+
+
+@dataclass
+class Chunk:
+    index: int
+    text: str
+    start: int  # offset (en caracteres) dentro del texto original
+    end: int
+
+
+def _is_heading(line: str) -> bool:
+    s = line.strip()
+    if not s or len(s) > 120:
+        return False
+    if s.startswith("#"):
+        return True
+    # Títulos en MAYÚSCULAS (ej. "FLOTACIÓN DE COBRE Y MOLIBDENO: ...")
+    letters = [c for c in s if c.isalpha()]
+    if len(letters) >= 4 and all(c.isupper() for c in letters):
+        return True
+    # Títulos numerados (ej. "2.1 Control de densidad")
+    return bool(re.match(r"^\d+(\.\d+)*\.?\s+\S", s)) and not s.endswith(".")
+
+
+def _spans_to_chunks(text: str, spans: List[tuple]) -> List[Chunk]:
+    out: List[Chunk] = []
+    for start, end in spans:
+        # Recorta espacios sin perder los offsets reales
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            out.append(Chunk(index=len(out), text=text[start:end], start=start, end=end))
+    return out
+
+
+def _char_spans(text: str, start: int, end: int, chunk_size: int, overlap: int) -> List[tuple]:
+    spans = []
+    pos = start
+    while pos < end:
+        stop = min(pos + chunk_size, end)
+        if stop < end:
+            # Evita cortar palabras: retrocede hasta el último espacio
+            cut = text.rfind(" ", pos + chunk_size // 2, stop)
+            if cut > pos:
+                stop = cut
+        spans.append((pos, stop))
+        if stop >= end:
+            break
+        pos = max(stop - overlap, pos + 1)
+    return spans
+
+
+def _sentence_spans(text: str, start: int, end: int, chunk_size: int, overlap: int) -> List[tuple]:
+    sents = [(m.start() + start, m.end() + start) for m in _SENTENCE_RE.finditer(text[start:end]) if m.group().strip()]
+    spans = []
+    prev_end = -1
+    i = 0
+    while i < len(sents):
+        j = i
+        while j + 1 < len(sents) and sents[j + 1][1] - sents[i][0] <= chunk_size:
+            j += 1
+        s0, s1 = sents[i][0], sents[j][1]
+        if s1 <= prev_end:
+            # La oración siguiente no cabe junto al overlap: la ventana quedaría
+            # dentro del chunk anterior (duplicado). Se sigue sin overlap.
+            i = j + 1
+            continue
+        prev_end = s1
+        if s1 - s0 > chunk_size:
+            # Oración más larga que el chunk: se corta por caracteres
+            spans.extend(_char_spans(text, s0, s1, chunk_size, overlap))
+        else:
+            spans.append((s0, s1))
+        if j + 1 >= len(sents):
+            break
+        # Overlap: retrocede oraciones completas mientras quepan en `overlap`
+        k = j + 1
+        while k - 1 > i and sents[j][1] - sents[k - 1][0] <= overlap:
+            k -= 1
+        i = k
+    return spans
+
+
+def _heading_spans(text: str, chunk_size: int, overlap: int) -> List[tuple]:
+    starts = [0]
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        if pos > 0 and _is_heading(line):
+            starts.append(pos)
+        pos += len(line)
+    bounds = list(zip(starts, starts[1:] + [len(text)]))
+
+    spans = []
+    for s0, s1 in bounds:
+        if s1 - s0 <= chunk_size:
+            spans.append((s0, s1))
+        else:
+            spans.extend(_sentence_spans(text, s0, s1, chunk_size, overlap))
+    return spans
+
+
+def chunk_text(
+    text: str,
+    strategy: str = DEFAULT_STRATEGY,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overlap: int = DEFAULT_OVERLAP,
+) -> List[Chunk]:
+    """
+    Divide `text` en chunks con offsets [start, end) sobre el texto original.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Estrategia de chunking desconocida: {strategy!r} (usa {STRATEGIES})")
+    if chunk_size <= 0:
+        raise ValueError("chunk_size debe ser > 0")
+    overlap = max(0, min(overlap, chunk_size // 2))
+
+    if strategy == "chars":
+        spans = _char_spans(text, 0, len(text), chunk_size, overlap)
+    elif strategy == "sentences":
+        spans = _sentence_spans(text, 0, len(text), chunk_size, overlap)
+    else:
+        spans = _heading_spans(text, chunk_size, overlap)
+
+    return _spans_to_chunks(text, spans)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import re
+import unicodedata
+
+
+# -----------------------------
+# Metadata estructurada de documentos (ingesta) y filtros (search)
+# -----------------------------
+# En la ingesta cada chunk recibe `area` (área de planta), `doc_type` y
+# `date` (YYYY-MM-DD) + `date_int` (YYYYMMDD, para filtros por rango en Chroma).
+# Se derivan del nombre del archivo (y del texto si el nombre no basta).
+# La fecha solo se registra si aparece en el nombre o al inicio del texto: el
+# mtime es la fecha de copia/checkout, no la del documento.
+# Cambiar estas reglas => subir METADATA_VERSION (el manifiesto re-ingesta).
+METADATA_VERSION = 2
+
+# Área -> palabras clave (sin tildes, minúsculas). El primer match gana.
+AREA_KEYWORDS = {
+    "chancado": ("chancado", "chancador", "trituracion"),
+    "molienda": ("molienda", "molino", "sag", "hidrociclon", "bolas"),
+    "flotacion": ("flotacion", "rougher", "cleaner", "scavenger", "colector", "espumante"),
+    "espesamiento": ("espesamiento", "espesador", "floculante", "underflow"),
+    "relaves": ("relave", "relaves", "tranque"),
+    "filtrado": ("filtrado", "filtro", "secado"),
+    "lixiviacion": ("lixiviacion", "sx-ew", "electroobtencion"),
+}
+
+DOC_TYPE_KEYWORDS = {
+    "procedimiento": ("procedimiento", "instructivo"),
+    "manual": ("manual",),
+    "informe": ("informe", "reporte"),
+    "operacional": ("control operacional", "aspectos operacionales", "operacional"),
+}
+
+_DATE_RE = re.compile(r"(20\d{2}|19\d{2})[-_.]?(0[1-9]|1[0-2])[-_.]?(0[1-9]|[12]\d|3[01])")
+# En el texto además: 15/03/2024, 15-03-2024, "15 de marzo de 2024"
+_DMY_RE = re.compile(r"(?<!\d)(0?[1-9]|[12]\d|3[01])[/.-](0?[1-9]|1[0-2])[/.-](20\d{2}|19\d{2})(?!\d)")
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+_SPANISH_DATE_RE = re.compile(
+    r"(?<!\d)(0?[1-9]|[12]\d|3[01]) de (" + "|".join(MONTHS) + r")(?: de| del)? (20\d{2}|19\d{2})(?!\d)"
+)
+
+# Claves aceptadas en `filters` de search() / endpoints
+FILTER_KEYS = ("source", "parent_id", "area", "doc_type", "date_from", "date_to")
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").lower()
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _first_match(haystack: str, table: Dict[str, tuple]) -> Optional[str]:
+    for label, words in table.items():
+        if any(re.search(rf"(?<![a-z0-9]){re.escape(w)}(?![a-z0-9])", haystack) for w in words):
+            return label
+    return None
+
+
+def _valid_date(year: str, month: str, day: str) -> Optional[str]:
+    try:
+        return datetime(int(year), int(month), int(day)).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _find_date(name: str, head: str) -> Optional[str]:
+    m = _DATE_RE.search(name)
+    if m:
+        return _valid_date(m.group(1), m.group(2), m.group(3))
+    m = _DATE_RE.search(head)
+    if m:
+        return _valid_date(m.group(1), m.group(2), m.group(3))
+    m = _DMY_RE.search(head)
+    if m:
+        return _valid_date(m.group(3), m.group(2), m.group(1))
+    m = _SPANISH_DATE_RE.search(head)
+    if m:
+        return _valid_date(m.group(3), str(MONTHS[m.group(2)]), m.group(1))
+    return None
+
+
+def derive_metadata(path: Path, text: str = "", head_chars: int = 400) -> Dict[str, Any]:
+    """
+    Metadata de documento: area, doc_type, date/date_int (si se pueden inferir).
+    La fecha sale del nombre (YYYY-MM-DD, YYYYMMDD...) o del inicio del texto;
+    si no aparece, el documento queda sin fecha (los filtros por fecha lo excluyen).
+    """
+    name = _fold(path.stem).replace("_", " ")
+    head = _fold(text[:head_chars])
+    meta: Dict[str, Any] = {}
+
+    area = _first_match(name, AREA_KEYWORDS) or _first_match(head, AREA_KEYWORDS)
+    if area:
+        meta["area"] = area
+    doc_type = _first_match(name, DOC_TYPE_KEYWORDS) or _first_match(head, DOC_TYPE_KEYWORDS)
+    meta["doc_type"] = doc_type or "documento"
+
+    date = _find_date(path.stem, head)
+    if date:
+        meta["date"] = date
+        meta["date_int"] = int(date.replace("-", ""))
+    return meta
+
+
+def _date_int(value: Any) -> int:
+    digits = re.sub(r"\D", "", str(value))
+    if len(digits) != 8:
+        raise ValueError(f"Fecha inválida en filtros: {value!r} (usa YYYY-MM-DD)")
+    return int(digits)
+
+
+def _clauses(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if not isinstance(filters, dict):
+        raise ValueError("'filters' debe ser un objeto, ej. {\"area\": \"flotacion\"}")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Filtros no soportados: {sorted(unknown)} (opciones: {', '.join(FILTER_KEYS)})")
+    clauses = []
+    for key in ("source", "parent_id", "area", "doc_type"):
+        value = filters.get(key)
+        if value is None or value == [] or value == "":
+            continue
+        if isinstance(value, (list, tuple)):
+            clauses.append({key: {"$in": [str(v) for v in value]}})
+        else:
+            clauses.append({key: str(value)})
+    if filters.get("date_from"):
+        clauses.append({"date_int": {"$gte": _date_int(filters["date_from"])}})
+    if filters.get("date_to"):
+        clauses.append({"date_int": {"$lte": _date_int(filters["date_to"])}})
+    return clauses
+
+
+def to_chroma_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    {"area": "flotacion", "date_from": "2024-01-01"} -> `where` de Chroma.
+    Un valor lista se traduce a $in. Sin filtros -> None.
+    """
+    clauses = _clauses(filters or {})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def to_predicate(filters: Optional[Dict[str, Any]]) -> Optional[Callable[[Dict[str, Any]], bool]]:
+    """
+    Mismo filtro, como función sobre la metadata (para el índice BM25).
+    """
+    clauses = _clauses(filters or {})
+    if not clauses:
+        return None
+
+    def matches(meta: Dict[str, Any]) -> bool:
+        for clause in clauses:
+            (key, cond), = clause.items()
+            value = meta.get(key)
+            if not isinstance(cond, dict):
+                if value != cond:
+                    return False
+            elif "$in" in cond and value not in cond["$in"]:
+                return False
+            elif "$gte" in cond and (value is None or value < cond["$gte"]):
+                return False
+            elif "$lte" in cond and (value is None or value > cond["$lte"]):
+                return False
+        return True
+
+    return matches
+
+
+def filters_key(filters: Optional[Dict[str, Any]]) -> tuple:
+    """
+    Forma hashable y canónica de `filters` (clave de caché).
+    """
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (k, tuple(sorted(map(str, v))) if isinstance(v, (list, tuple)) else str(v))
+        for k, v in filters.items() if v not in (None, "", [])
+    ))
@@ -0,0 +1,65 @@
+from __future__ import annotations
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+import multiprocessing as mp
+import os
+
+from bd.embeddings import DEFAULT_CONFIG, EmbeddingConfig, build_encoder
+
+
+# -----------------------------
+# Pool de procesos para embeddings (ingesta)
+# -----------------------------
+# Cada worker carga su propia copia del modelo; con `torch_threads` se limita
+# el paralelismo intra-op (torch u ONNX Runtime) para que workers * threads ~= núcleos.
+_model = None
+
+
+def _init_worker(config: EmbeddingConfig, torch_threads: Optional[int]) -> None:
+    global _model
+    if torch_threads:
+        os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+        if config.backend.startswith("onnx"):
+            os.environ["ONNX_INTRA_OP_THREADS"] = str(torch_threads)
+        else:
+            import torch
+
+            torch.set_num_threads(torch_threads)
+
+    # Mismo backend (y parámetros de encode) que las consultas, para que los
+    # vectores precomputados coincidan con los de bd.chroma_store.
+    _model = build_encoder(config)
+
+
+def _embed(texts: List[str]) -> List[List[float]]:
+    return _model(texts)
+
+
+class EmbeddingPool:
+    """
+    Calcula embeddings en `workers` procesos; `submit` retorna un Future.
+    """
+
+    def __init__(self, workers: int, torch_threads: Optional[int] = None, config: EmbeddingConfig = DEFAULT_CONFIG):
+        if workers < 1:
+            raise ValueError("workers debe ser >= 1")
+        self.workers = workers
+        # "spawn": torch no es fork-safe una vez inicializado
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(config, torch_threads),
+        )
+
+    def submit(self, texts: List[str]) -> Future:
+        return self._executor.submit(_embed, texts)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
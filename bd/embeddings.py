@@ -0,0 +1,112 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import os
+
+
+# -----------------------------
+# Backend de embeddings configurable
+# -----------------------------
+# EMBEDDING_MODEL: nombre del modelo (HF / sentence-transformers).
+# EMBEDDING_BACKEND:
+#   - "sentence-transformers": PyTorch fp32 (por defecto, igual que antes)
+#   - "torch-int8":            PyTorch con cuantización dinámica int8 de las capas Linear (CPU)
+#   - "onnx":                  ONNX Runtime fp32 (bd.onnx_embed; exporta el modelo la primera vez)
+#   - "onnx-int8":             ONNX Runtime con cuantización dinámica int8
+# Modelos más livianos para CPU (multilingües, el corpus es en español):
+#   sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2, intfloat/multilingual-e5-small
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE") or None
+BACKENDS = ("sentence-transformers", "torch-int8", "onnx", "onnx-int8")
+
+# Colecciones creadas antes de registrar el modelo en su metadata se
+# construyeron con el modelo que estaba fijo en el código.
+LEGACY_EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"
+
+
+class EmbeddingModelMismatch(RuntimeError):
+    """
+    La colección fue construida con otro modelo: sus vectores no son
+    comparables con los de la consulta (hay que re-ingestar con --force).
+    """
+
+
+@dataclass(frozen=True)
+class EmbeddingConfig:
+    model: str = EMBEDDING_MODEL
+    backend: str = EMBEDDING_BACKEND
+    device: Optional[str] = EMBEDDING_DEVICE
+
+    def __post_init__(self):
+        if self.backend not in BACKENDS:
+            raise ValueError(f"EMBEDDING_BACKEND inválido: {self.backend!r} (opciones: {', '.join(BACKENDS)})")
+
+    @property
+    def key(self) -> str:
+        """
+        Identifica el espacio vectorial: se usa como clave de las cachés de
+        embeddings (un vector int8 no se mezcla con uno fp32).
+        """
+        return self.model if self.backend == "sentence-transformers" else f"{self.backend}:{self.model}"
+
+    def collection_metadata(self) -> Dict[str, Any]:
+        return {"embedding_model": self.model, "embedding_backend": self.backend}
+
+
+DEFAULT_CONFIG = EmbeddingConfig()
+
+
+class SentenceTransformerBackend:
+    """
+    Callable list[str] -> list[list[float]]. Mismos parámetros de encode que
+    SentenceTransformerEmbeddingFunction de Chroma (sin normalizar), con la que
+    se ingirieron las colecciones antiguas: los vectores coinciden.
+    """
+
+    def __init__(self, config: EmbeddingConfig = DEFAULT_CONFIG):
+        from sentence_transformers import SentenceTransformer
+
+        self.config = config
+        self.model = SentenceTransformer(config.model, device=config.device)
+        if config.backend == "torch-int8":
+            import torch
+
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.model.encode(list(input), convert_to_numpy=True, normalize_embeddings=False).tolist()
+
+
+def build_encoder(config: EmbeddingConfig = DEFAULT_CONFIG):
+    """
+    Función de embeddings para `config` (ej. workers de ingesta).
+    """
+    if config.backend in ("onnx", "onnx-int8"):
+        from bd.onnx_embed import OnnxEmbeddingFunction
+
+        return OnnxEmbeddingFunction(config.model, quantized=config.backend == "onnx-int8")
+    return SentenceTransformerBackend(config)
+
+
+def build_embedding_fn(config: EmbeddingConfig = DEFAULT_CONFIG):
+    """
+    Construye la función de embeddings para `config` (carga el modelo).
+    Chroma no la recibe: las colecciones se abren sin función de embeddings
+    (ver bd.chroma_store.ChromaStore.open), así que cualquier backend sirve.
+    """
+    return build_encoder(config)
+
+
+def check_collection_model(metadata: Optional[Dict[str, Any]], config: EmbeddingConfig, name: str) -> str:
+    """
+    Modelo registrado en la metadata de la colección; lanza
+    EmbeddingModelMismatch si no coincide con `config.model`.
+    """
+    recorded = (metadata or {}).get("embedding_model") or LEGACY_EMBEDDING_MODEL
+    if recorded != config.model:
+        raise EmbeddingModelMismatch(
+            f"La colección {name!r} fue construida con {recorded!r}, pero EMBEDDING_MODEL={config.model!r}. "
+            f"Usa el mismo modelo o re-ingesta con --force en un CHROMA_DIR nuevo."
+        )
+    return recorded
@@ -0,0 +1,280 @@
+from __future__ import annotations
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import json
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+
+
+# -----------------------------
+# Índice invertido BM25 (retrieval léxico)
+# -----------------------------
+# Complementa los embeddings en tokens exactos (tags de equipos, reactivos,
+# "SAG", "pH", "torque"). Se persiste en SQLite (una fila por chunk, upsert
+# incremental) y se carga completo en memoria para consultar.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a al algo como con cual cuales cuando de del desde donde el ella en entre era es esta este esto
+hay la las le les lo los mas me mi muy no o para pero por porque que se si sin sobre su sus
+tambien te tiene un una uno unos unas y ya
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Minúsculas, sin tildes; conserva tags como "tk-301" o "p80" como un token.
+    """
+    text = unicodedata.normalize("NFKD", text or "").lower()
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Índice BM25 thread-safe. `path` (SQLite) es opcional: sin él vive solo en memoria.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # id -> (texto, metadata, largo en tokens, frecuencias por término)
+        self._docs: Dict[str, Tuple[str, Dict[str, Any], int, Dict[str, int]]] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_len = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        # Marca de agua de lo ya cargado desde SQLite: (época, secuencia)
+        self._epoch: Optional[int] = None
+        self._seq = 0
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.reload(full=True)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # Conexión perezosa: se (re)abre tras close() si alguien sigue usando el índice
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bm25_docs ("
+                " id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            # Cada escritura lleva un número de secuencia (bm25_meta.seq); los
+            # borrados dejan una lápida. Así otro proceso aplica solo lo nuevo.
+            # `epoch` cambia con clear(): obliga a recargar completo.
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(bm25_docs)")}
+            if "seq" not in columns:
+                conn.execute("ALTER TABLE bm25_docs ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS bm25_docs_seq ON bm25_docs (seq)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bm25_deleted (id TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS bm25_deleted_seq ON bm25_deleted (seq)")
+            conn.execute("CREATE TABLE IF NOT EXISTS bm25_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO bm25_meta (key, value) VALUES ('seq', 0), ('epoch', 0)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        """
+        Cierra la conexión SQLite (el índice en memoria sigue consultable).
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _meta(conn: sqlite3.Connection) -> Tuple[int, int]:
+        meta = dict(conn.execute("SELECT key, value FROM bm25_meta").fetchall())
+        return int(meta.get("epoch", 0)), int(meta.get("seq", 0))
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection) -> int:
+        # El UPDATE abre la transacción de escritura: la secuencia es única entre procesos
+        conn.execute("UPDATE bm25_meta SET value = value + 1 WHERE key = 'seq'")
+        return conn.execute("SELECT value FROM bm25_meta WHERE key = 'seq'").fetchone()[0]
+
+    def reload(self, full: bool = False) -> None:
+        """
+        Trae desde SQLite los cambios hechos por otros procesos (ej. una
+        ingesta): solo las filas y borrados posteriores a lo ya cargado.
+        Recarga completo con `full`, en la primera carga o tras un clear().
+        """
+        with self._lock:
+            conn = self._db()
+            if conn is None:
+                return
+            # Una sola transacción de lectura: meta y filas del mismo snapshot
+            conn.execute("BEGIN")
+            try:
+                epoch, seq = self._meta(conn)
+                if full or epoch != self._epoch:
+                    rows = conn.execute("SELECT id, text, metadata FROM bm25_docs").fetchall()
+                    self._docs.clear()
+                    self._postings.clear()
+                    self._total_len = 0
+                    for _id, text, meta in rows:
+                        self._index(_id, text, json.loads(meta))
+                elif seq != self._seq:
+                    deleted = conn.execute("SELECT id FROM bm25_deleted WHERE seq > ?", (self._seq,)).fetchall()
+                    rows = conn.execute(
+                        "SELECT id, text, metadata FROM bm25_docs WHERE seq > ?", (self._seq,)
+                    ).fetchall()
+                    for (_id,) in deleted:
+                        self._unindex(_id)
+                    for _id, text, meta in rows:
+                        self._unindex(_id)
+                        self._index(_id, text, json.loads(meta))
+            finally:
+                conn.commit()
+            self._epoch, self._seq = epoch, seq
+
+    def _index(self, _id: str, text: str, meta: Dict[str, Any]) -> None:
+        tf = Counter(tokenize(text))
+        length = sum(tf.values())
+        self._docs[_id] = (text, meta, length, dict(tf))
+        self._total_len += length
+        for term, n in tf.items():
+            self._postings[term][_id] = n
+
+    def _unindex(self, _id: str) -> None:
+        doc = self._docs.pop(_id, None)
+        if doc is None:
+            return
+        self._total_len -= doc[2]
+        for term in doc[3]:
+            post = self._postings.get(term)
+            if post is not None:
+                post.pop(_id, None)
+                if not post:
+                    del self._postings[term]
+
+    # Escrituras propias: se aplican en memoria sin mover la marca de agua,
+    # así el próximo reload() no se salta cambios de otros procesos intercalados
+    # (a lo más re-aplica estos mismos, que es idempotente).
+    def upsert(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for _id, text, meta in zip(ids, texts, metadatas):
+                self._unindex(_id)
+                self._index(_id, text, meta or {})
+            conn = self._db()
+            if conn is not None:
+                seq = self._next_seq(conn)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO bm25_docs (id, text, metadata, seq) VALUES (?, ?, ?, ?)",
+                    [
+                        (i, t, json.dumps(m or {}, ensure_ascii=False), seq)
+                        for i, t, m in zip(ids, texts, metadatas)
+                    ],
+                )
+                conn.executemany("DELETE FROM bm25_deleted WHERE id = ?", [(i,) for i in ids])
+                conn.commit()
+
+    def delete(self, ids: Optional[Iterable[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Borra por ids y/o por igualdad de metadata (`where={"parent_id": ...}`).
+        """
+        with self._lock:
+            targets = set(ids or [])
+            if where:
+                targets.update(
+                    _id for _id, doc in self._docs.items()
+                    if all(doc[1].get(k) == v for k, v in where.items())
+                )
+            for _id in targets:
+                self._unindex(_id)
+            conn = self._db()
+            if conn is not None and targets:
+                seq = self._next_seq(conn)
+                conn.executemany("DELETE FROM bm25_docs WHERE id = ?", [(i,) for i in targets])
+                conn.executemany(
+                    "INSERT OR REPLACE INTO bm25_deleted (id, seq) VALUES (?, ?)", [(i, seq) for i in targets]
+                )
+                conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_len = 0
+            conn = self._db()
+            if conn is not None:
+                conn.execute("DELETE FROM bm25_docs")
+                conn.execute("DELETE FROM bm25_deleted")
+                conn.execute("UPDATE bm25_meta SET value = value + 1 WHERE key = 'epoch'")
+                conn.commit()
+                self._epoch, self._seq = self._meta(conn)
+
+    def known_terms(self, query: str) -> Tuple[List[str], bool]:
+        """
+        (tokens de la consulta, todos ellos existen en el índice).
+        """
+        terms = tokenize(query)
+        with self._lock:
+            return terms, bool(terms) and all(t in self._postings for t in terms)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k por BM25: [{id, text, metadata, bm25}], mayor puntaje primero.
+        `where` (metadata -> bool) restringe los documentos candidatos.
+        """
+        terms = tokenize(query)
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avgdl = self._total_len / n
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(terms):
+                post = self._postings.get(term)
+                if not post:
+                    continue
+                idf = math.log(1 + (n - len(post) + 0.5) / (len(post) + 0.5))
+                for _id, tf in post.items():
+                    if where is not None and not where(self._docs[_id][1]):
+                        continue
+                    dl = self._docs[_id][2]
+                    scores[_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+            best = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:top_k]
+            return [
+                {"id": _id, "text": self._docs[_id][0], "metadata": dict(self._docs[_id][1]), "bm25": round(s, 4)}
+                for _id, s in best
+            ]
+
+
+def rrf_fuse(rankings: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Reciprocal-rank fusion: score(d) = sum 1 / (k + rank). Cada lista viene
+    ordenada (mejor primero); los campos de un mismo id se combinan.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    merged: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, 1):
+            scores[hit["id"]] += 1.0 / (k + rank)
+            merged.setdefault(hit["id"], {}).update({key: v for key, v in hit.items() if v is not None})
+    best = sorted(scores, key=lambda _id: -scores[_id])[:top_k]
+    out = []
+    for _id in best:
+        hit = merged[_id]
+        hit.setdefault("distance", None)
+        hit["score"] = round(scores[_id], 6)
+        out.append(hit)
+    return out
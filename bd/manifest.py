@@ -0,0 +1,146 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+import hashlib
+import json
+import os
+
+from bd.chroma_store import sidecar_path
+
+
+def manifest_path(collection: Optional[str] = None) -> Path:
+    """
+    Manifiesto de ingesta de una colección, al lado de chroma_db/
+    (no dentro: ese directorio lo maneja Chroma).
+    """
+    return sidecar_path("chroma_manifest.json", collection)
+
+
+MANIFEST_PATH = manifest_path()
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Registro por archivo fuente: hash de contenido, mtime, tamaño y chunk ids.
+    Permite re-ingestar solo lo nuevo/modificado y borrar chunks huérfanos.
+
+    `partial` guarda, para archivos a medio ingerir, los chunk ids de lotes
+    ya confirmados: tras un crash la ingesta retoma sin re-embeberlos.
+    """
+
+    def __init__(self, path: Path = MANIFEST_PATH, data: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.data = data or {"version": MANIFEST_VERSION, "sources": {}}
+
+    @classmethod
+    def load(cls, path: Path = MANIFEST_PATH) -> "Manifest":
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"Manifiesto ilegible ({e}); se re-ingesta todo.")
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data)
+
+    def save(self) -> None:
+        # Escritura atómica: un crash a mitad no deja un JSON corrupto
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    @property
+    def sources(self) -> Dict[str, Dict[str, Any]]:
+        return self.data["sources"]
+
+    @property
+    def partial(self) -> Dict[str, Dict[str, Any]]:
+        return self.data.setdefault("partial", {})
+
+    def is_unchanged(self, path: Path, chunking: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        True si el archivo no cambió (ni los parámetros de chunking con que se
+        ingestó). Compara mtime+tamaño (barato) y solo si difieren calcula el
+        hash; un "touch" sin cambios no re-embebe.
+        """
+        entry = self.sources.get(str(path))
+        if entry is None:
+            return False
+        if chunking is not None and entry.get("chunking") != chunking:
+            return False
+        st = path.stat()
+        if entry.get("mtime") == st.st_mtime and entry.get("size") == st.st_size:
+            return True
+        if entry.get("sha256") == file_sha256(path):
+            entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+            return True
+        return False
+
+    def record(
+        self,
+        path: Path,
+        parent_id: str,
+        chunk_ids: List[str],
+        sha256: Optional[str] = None,
+        chunking: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        st = path.stat()
+        self.partial.pop(str(path), None)
+        self.sources[str(path)] = {
+            "parent_id": parent_id,
+            "chunking": chunking,
+            "sha256": sha256 or file_sha256(path),
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "chunk_ids": list(chunk_ids),
+        }
+
+    def record_partial(
+        self,
+        path: Path,
+        chunk_ids: List[str],
+        sha256: str,
+        chunking: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Agrega chunks confirmados de un archivo que aún no termina de ingerirse.
+        """
+        entry = self.partial.get(str(path))
+        if entry is None or entry.get("sha256") != sha256 or entry.get("chunking") != chunking:
+            entry = self.partial[str(path)] = {"sha256": sha256, "chunking": chunking, "chunk_ids": []}
+        seen = set(entry["chunk_ids"])
+        entry["chunk_ids"].extend(i for i in chunk_ids if i not in seen)
+
+    def committed_chunk_ids(self, path: Path, sha256: str, chunking: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Chunks ya confirmados de una ingesta interrumpida del MISMO contenido
+        y chunking (si el archivo cambió, no sirven: se re-ingesta entero).
+        """
+        entry = self.partial.get(str(path))
+        if entry is None or entry.get("sha256") != sha256 or entry.get("chunking") != chunking:
+            return []
+        return list(entry["chunk_ids"])
+
+    def forget(self, source: str) -> List[str]:
+        """
+        Elimina la entrada (y su avance parcial) y retorna sus chunk ids
+        (para borrarlos de Chroma).
+        """
+        entry = self.sources.pop(source, None) or {}
+        partial = self.partial.pop(source, None) or {}
+        return list(dict.fromkeys(entry.get("chunk_ids", []) + partial.get("chunk_ids", [])))
+
+    def chunk_ids(self, source: str) -> List[str]:
+        return list((self.sources.get(source) or {}).get("chunk_ids", []))
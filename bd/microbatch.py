@@ -0,0 +1,131 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import threading
+import time
+
+from metrics import Gauge, Histogram
+
+
+# -----------------------------
+# Micro-batching de llamadas a un modelo
+# -----------------------------
+# Bajo carga, cada request embebe su consulta por separado: muchos forward
+# pass de 1 texto. MicroBatcher pone una cola delante del modelo: un thread
+# toma lo que llegó dentro de una ventana corta (max_wait_ms desde el primer
+# texto en cola) o hasta max_batch_size textos, los pasa juntos al modelo y
+# resuelve el Future de cada llamador. Mientras el modelo está ocupado, lo que
+# llega se acumula y sale en el siguiente batch, así que la ventana solo
+# agrega latencia a una consulta aislada (y es de pocos ms).
+QUEUE_DEPTH = Gauge("rag_microbatch_queue_depth", "Textos esperando en la cola de micro-batching", ["batcher"])
+BATCH_SIZE = Histogram(
+    "rag_microbatch_batch_size",
+    "Textos por llamada al modelo (micro-batching)",
+    ["batcher"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "rag_microbatch_queue_wait_seconds",
+    "Espera en cola antes de entrar a un batch",
+    ["batcher"],
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class MicroBatcher:
+    """
+    Callable list[str] -> list[resultado] que agrupa llamadas concurrentes
+    a `fn` (misma interfaz). Textos repetidos dentro de un batch se
+    calculan una sola vez. Un error en `fn` se propaga a todo el batch.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[str]], List[Any]],
+        *,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        name: str = "embedding",
+    ):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        # (texto, future, momento de llegada)
+        self._queue: Deque[Tuple[str, Future, float]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.items = 0
+
+    def __call__(self, input: List[str]) -> List[Any]:
+        return [f.result() for f in self.submit(list(input))]
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        futures = [Future() for _ in texts]
+        now = time.monotonic()
+        with self._cond:
+            # Arranca el thread en el primer uso (o lo revive si murió)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+                self._thread.start()
+            self._queue.extend((t, f, now) for t, f in zip(texts, futures))
+            QUEUE_DEPTH.set(len(self._queue), batcher=self.name)
+            self._cond.notify()
+        return futures
+
+    def _next_batch(self) -> List[Tuple[str, Future, float]]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # Ventana desde el más antiguo: si ya esperó (modelo ocupado), sale de inmediato
+            deadline = self._queue[0][2] + self.max_wait_s
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.max_batch_size)
+            batch = [self._queue.popleft() for _ in range(n)]
+            QUEUE_DEPTH.set(len(self._queue), batcher=self.name)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            except BaseException as e:
+                # Ningún llamador queda esperando un Future que nunca se resuelve
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+
+    def _process(self, batch: List[Tuple[str, Future, float]]) -> None:
+        now = time.monotonic()
+        unique: Dict[str, int] = {}
+        for text, _, queued_at in batch:
+            unique.setdefault(text, len(unique))
+        self.batches += 1
+        self.items += len(batch)
+        results = self.fn(list(unique))
+        if len(results) != len(unique):
+            raise RuntimeError(f"{self.name}: {len(results)} resultados para {len(unique)} textos")
+        for text, future, _ in batch:
+            future.set_result(results[unique[text]])
+        for _, _, queued_at in batch:
+            QUEUE_WAIT_SECONDS.observe(now - queued_at, batcher=self.name)
+        BATCH_SIZE.observe(len(unique), batcher=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._queue),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait_s * 1000, 3),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 3) if self.batches else 0.0,
+        }
@@ -0,0 +1,210 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import os
+import re
+import threading
+
+
+# -----------------------------
+# Embeddings con ONNX Runtime (sin torch en los workers de la API)
+# -----------------------------
+# El modelo se exporta UNA vez (requiere torch + sentence-transformers) a
+# ONNX_CACHE_DIR/<modelo>/: model.onnx, model_int8.onnx (cuantización
+# dinámica int8), tokenizer.json y onnx_config.json (pooling, normalización,
+# largo máximo). En ejecución solo se necesitan onnxruntime + tokenizers.
+#
+# Exportar por adelantado (ej. en el build de la imagen):
+#   python -m bd.onnx_embed --model BAAI/bge-large-en-v1.5
+#
+# ONNX_INTRA_OP_THREADS: threads por inferencia. Con RETRIEVAL_WORKERS
+# consultas en paralelo, conviene RETRIEVAL_WORKERS * threads ~= núcleos.
+ONNX_CACHE_DIR = Path(os.getenv("ONNX_CACHE_DIR") or Path(__file__).resolve().parents[1] / "onnx_models")
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+CONFIG_NAME = "onnx_config.json"
+POOLING_MODES = ("cls", "mean", "max")
+
+_export_lock = threading.Lock()
+
+
+def model_dir(model_name: str, cache_dir: Path = ONNX_CACHE_DIR) -> Path:
+    return Path(cache_dir) / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+
+def export_model(model_name: str, cache_dir: Path = ONNX_CACHE_DIR, quantize: bool = True) -> Path:
+    """
+    Exporta `model_name` (sentence-transformers) a ONNX y, con `quantize`,
+    también su variante int8. Retorna el directorio con los artefactos.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out = model_dir(model_name, cache_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0]
+    pooling_module = next((m for m in st if type(m).__name__ == "Pooling"), None)
+    pooling = pooling_module.get_pooling_mode_str() if pooling_module is not None else None
+    if pooling not in POOLING_MODES:
+        raise ValueError(f"Pooling no soportado para ONNX: {pooling!r} ({model_name})")
+    normalize = any(type(m).__name__ == "Normalize" for m in st)
+
+    tokenizer = transformer.tokenizer
+    hf_model = transformer.auto_model.eval()
+    dummy = tokenizer(["exportación onnx"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(input_names, args))).last_hidden_state
+
+    axes = {n: {0: "batch", 1: "seq"} for n in input_names + ["last_hidden_state"]}
+    export_kwargs: Dict[str, Any] = dict(
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=axes,
+        opset_version=17,
+        do_constant_folding=True,
+    )
+    with torch.no_grad():
+        args = tuple(dummy[n] for n in input_names)
+        try:
+            # Exportador TorchScript (dynamic_axes); torch reciente usa dynamo por defecto
+            torch.onnx.export(_LastHiddenState(hf_model), args, str(out / "model.onnx"), dynamo=False, **export_kwargs)
+        except TypeError:
+            torch.onnx.export(_LastHiddenState(hf_model), args, str(out / "model.onnx"), **export_kwargs)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(out / "model.onnx"), str(out / "model_int8.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(str(out))
+    config = {
+        "model": model_name,
+        "pooling": pooling,
+        "normalize": normalize,
+        "max_seq_length": int(st.max_seq_length or tokenizer.model_max_length),
+        "input_names": input_names,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+    # Se escribe al final: su presencia marca una exportación completa
+    (out / CONFIG_NAME).write_text(json.dumps(config, indent=2), encoding="utf-8")
+    return out
+
+
+def ensure_exported(model_name: str, quantized: bool, cache_dir: Path = ONNX_CACHE_DIR) -> Path:
+    out = model_dir(model_name, cache_dir)
+    filename = "model_int8.onnx" if quantized else "model.onnx"
+    with _export_lock:
+        if not (out / CONFIG_NAME).exists() or not (out / filename).exists():
+            print(f"Exportando {model_name} a ONNX en {out} (solo la primera vez)")
+            export_model(model_name, cache_dir, quantize=True)
+    return out
+
+
+class OnnxEmbeddingFunction:
+    """
+    Callable list[str] -> list[list[float]] sobre ONNX Runtime, equivalente a
+    SentenceTransformer.encode(normalize_embeddings=False) del mismo modelo
+    (mismo pooling y, si el modelo la trae, misma normalización).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        quantized: bool = False,
+        intra_op_threads: int = ONNX_INTRA_OP_THREADS,
+        batch_size: int = ONNX_BATCH_SIZE,
+        cache_dir: Path = ONNX_CACHE_DIR,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        directory = ensure_exported(model_name, quantized, cache_dir)
+        self.config: Dict[str, Any] = json.loads((directory / CONFIG_NAME).read_text(encoding="utf-8"))
+        self.model_name = model_name
+        self.quantized = quantized
+        self.batch_size = max(1, batch_size)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.inter_op_num_threads = 1
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = intra_op_threads
+        path = directory / ("model_int8.onnx" if quantized else "model.onnx")
+        self.session = ort.InferenceSession(str(path), sess_options=opts, providers=["CPUExecutionProvider"])
+
+        self.tokenizer = Tokenizer.from_file(str(directory / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        pad_id = self.config.get("pad_token_id")
+        self.tokenizer.enable_padding(
+            pad_id=pad_id if pad_id is not None else 0,
+            pad_token=self.config.get("pad_token") or "[PAD]",
+        )
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        texts = list(input)
+        out: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            out.extend(self._encode(texts[i:i + self.batch_size]).tolist())
+        return out
+
+    def _encode(self, texts: List[str]):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        columns = {
+            "input_ids": [e.ids for e in encodings],
+            "attention_mask": [e.attention_mask for e in encodings],
+            "token_type_ids": [e.type_ids for e in encodings],
+        }
+        feeds = {name: np.asarray(columns[name], dtype=np.int64) for name in self.config["input_names"]}
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        mask = feeds.get("attention_mask")
+        if mask is None:
+            mask = np.asarray(columns["attention_mask"], dtype=np.int64)
+        return _pool(hidden, mask, self.config["pooling"], self.config["normalize"])
+
+
+def _pool(hidden, mask, mode: str, normalize: bool):
+    import numpy as np
+
+    m = mask[..., None].astype(hidden.dtype)
+    if mode == "cls":
+        vecs = hidden[:, 0]
+    elif mode == "mean":
+        vecs = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+    else:
+        vecs = np.where(m > 0, hidden, -1e9).max(axis=1)
+    if normalize:
+        vecs = vecs / np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+    return vecs.astype(np.float32)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from bd.embeddings import EMBEDDING_MODEL
+
+    ap = argparse.ArgumentParser(description="Exporta un modelo sentence-transformers a ONNX (+ int8)")
+    ap.add_argument("--model", default=EMBEDDING_MODEL)
+    ap.add_argument("--cache-dir", type=Path, default=ONNX_CACHE_DIR)
+    ap.add_argument("--no-quantize", action="store_true")
+    args = ap.parse_args(argv)
+    out = export_model(args.model, args.cache_dir, quantize=not args.no_quantize)
+    print("Exportado en:", out)
+
+
+if __name__ == "__main__":
+    main()
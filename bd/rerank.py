@@ -0,0 +1,102 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import hashlib
+import os
+import threading
+
+from bd.cache import LRUCache, normalize_query
+from metrics import span
+
+
+# -----------------------------
+# Reranking con cross-encoder (opcional)
+# -----------------------------
+# search() trae RERANK_CANDIDATES candidatos, el cross-encoder puntúa cada par
+# (consulta, chunk) en batches y se quedan los top_k mejores. Los puntajes se
+# cachean por (modelo, consulta normalizada, chunk): una misma pregunta sobre
+# los mismos chunks no vuelve a pasar por el modelo.
+# RERANK_MODEL vacío lo desactiva (por defecto). Modelo pequeño y multilingüe:
+#   cross-encoder/mmarco-mMiniLMv2-L12-H384-v1
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+# Puntaje mínimo (opcional) para conservar un hit tras el reranking
+RERANK_MIN_SCORE: Optional[float] = float(os.environ["RERANK_MIN_SCORE"]) if os.getenv("RERANK_MIN_SCORE") else None
+
+
+def _chunk_key(hit: Dict[str, Any]) -> str:
+    # El id solo no basta: un chunk re-ingerido con otro texto conserva su id
+    text = hit.get("text") or ""
+    return f"{hit.get('id', '')}:{hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]}"
+
+
+class CrossEncoderReranker:
+    """
+    Reordena hits [{id, text, ...}] por relevancia según un cross-encoder.
+    El modelo se carga en el primer uso.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        *,
+        batch_size: int = RERANK_BATCH_SIZE,
+        max_length: int = RERANK_MAX_LENGTH,
+        cache_size: int = RERANK_CACHE_SIZE,
+        min_score: Optional[float] = RERANK_MIN_SCORE,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.min_score = min_score
+        self._cache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length)
+        return self._model
+
+    def scores(self, query: str, hits: List[Dict[str, Any]]) -> List[float]:
+        qkey = normalize_query(query)
+        out: List[Optional[float]] = []
+        missing: List[int] = []
+        for i, h in enumerate(hits):
+            s = self._cache.get((self.model_name, qkey, _chunk_key(h)))
+            out.append(s)
+            if s is None:
+                missing.append(i)
+
+        if missing:
+            pairs = [(query, hits[i].get("text") or "") for i in missing]
+            with span("rerank"):
+                fresh = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for i, s in zip(missing, fresh):
+                out[i] = float(s)
+                self._cache.put((self.model_name, qkey, _chunk_key(hits[i])), float(s))
+        return out
+
+    def rerank(self, query: str, hits: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Los `top_k` hits con mayor puntaje; cada uno lleva `rerank_score`.
+        """
+        if not hits:
+            return []
+        scored = []
+        for h, s in zip(hits, self.scores(query, hits)):
+            if self.min_score is not None and s < self.min_score:
+                continue
+            scored.append({**h, "rerank_score": round(s, 6)})
+        scored.sort(key=lambda h: -h["rerank_score"])
+        return scored[:top_k]
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
@@ -0,0 +1,355 @@
+# benchmark.py
+# Benchmark reproducible de ingesta, retrieval y generate_text (LLM simulado).
+#
+# Carga un corpus (data_txt/ o uno sintético) en un CHROMA_DIR temporal, corre
+# un set de consultas por bd.chroma_store.search y ai.chat.generate_text a
+# distintas concurrencias y escribe un JSON comparable entre commits:
+#
+#   python benchmark.py --out bench_a.json
+#   python benchmark.py --synthetic-docs 200 --concurrency 1,4,16 --out bench_b.json
+#   python benchmark.py --compare bench_a.json --out bench_b.json
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_QUERIES = [
+    "¿Qué variables afectan la potencia del molino SAG?",
+    "¿Cómo influye el pH en la flotación de cobre?",
+    "¿Qué significa un aumento de torque en un espesador?",
+    "¿Qué reactivos se usan para deprimir el molibdeno?",
+    "¿Cómo se controla la densidad de descarga del espesador de relaves?",
+    "¿Qué hacer si sube la presión de los descansos del molino?",
+    "¿Cuál es el efecto del tamaño de partícula en la recuperación?",
+    "¿Cómo se ajusta el nivel de espuma en las celdas rougher?",
+]
+
+# Vocabulario para el corpus sintético (determinista con --seed)
+_SYNTH_TERMS = [
+    "molino SAG", "chancador de pebbles", "hidrociclón", "celda rougher", "celda cleaner",
+    "espesador de relaves", "floculante", "colector xantato", "espumante", "cal",
+    "pH de pulpa", "torque del rastrillo", "densidad de descarga", "potencia del molino",
+    "presión de descansos", "nivel de espuma", "recuperación de cobre", "ley de concentrado",
+    "molibdenita", "depresor NaHS", "granulometría P80", "carga circulante", "agua recuperada",
+]
+_SYNTH_VERBS = ["aumenta", "disminuye", "se controla con", "depende de", "afecta a", "se mide junto a"]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Percentil con interpolación lineal (p en [0, 100]).
+    """
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def latency_summary(latencies_s: List[float]) -> Dict[str, float]:
+    ms = [x * 1000.0 for x in latencies_s]
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    RSS máximo del proceso hasta ahora (ru_maxrss: KB en Linux, bytes en macOS).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def write_synthetic_corpus(dest: Path, n_docs: int, paragraphs: int, seed: int) -> List[Path]:
+    rng = random.Random(seed)
+    paths = []
+    for d in range(n_docs):
+        lines = []
+        for _ in range(paragraphs):
+            sentences = []
+            for _ in range(rng.randint(3, 6)):
+                a, b = rng.sample(_SYNTH_TERMS, 2)
+                sentences.append(f"El {a} {rng.choice(_SYNTH_VERBS)} el {b} ({rng.randint(1, 99)}%).")
+            lines.append(" ".join(sentences))
+        p = dest / f"sintetico_{d:05d}.txt"
+        p.write_text("\n\n".join(lines), encoding="utf-8")
+        paths.append(p)
+    return paths
+
+
+def copy_corpus(src: Path, dest: Path) -> List[Path]:
+    paths = []
+    for p in sorted(src.glob("*.txt")):
+        target = dest / p.name
+        shutil.copyfile(p, target)
+        paths.append(target)
+    return paths
+
+
+def load_queries(path: Optional[Path]) -> List[str]:
+    """
+    Un archivo .json (lista de strings) o texto plano (una consulta por línea).
+    """
+    if path is None:
+        return list(DEFAULT_QUERIES)
+    text = path.read_text(encoding="utf-8")
+    if path.suffix == ".json":
+        return [str(q) for q in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def run_load(fn: Callable[[str], Any], queries: List[str], concurrency: int, total: int) -> Dict[str, Any]:
+    """
+    Ejecuta `total` llamadas fn(query) con `concurrency` threads.
+    Retorna latencias por llamada y QPS (llamadas / tiempo de pared).
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        nonlocal errors
+        q = queries[i % len(queries)]
+        t0 = time.perf_counter()
+        try:
+            fn(q)
+        except Exception as e:
+            with lock:
+                errors += 1
+            print("Error en consulta:", q, e)
+            return
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(one, range(total)))
+    wall = time.perf_counter() - t0
+
+    out = {"concurrency": concurrency, "requests": total, "errors": errors, "wall_s": round(wall, 3)}
+    out["qps"] = round(len(latencies) / wall, 3) if wall > 0 else 0.0
+    out.update(latency_summary(latencies))
+    return out
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """
+    Imprime la diferencia (%) de p50/p95/QPS por escenario y concurrencia.
+    """
+    print(f"\nComparación {old.get('commit')} -> {new.get('commit')}")
+    for scenario in ("search", "generate_text"):
+        old_runs = {r["concurrency"]: r for r in old.get(scenario, [])}
+        for run in new.get(scenario, []):
+            prev = old_runs.get(run["concurrency"])
+            if prev is None:
+                continue
+            cells = []
+            for key in ("p50_ms", "p95_ms", "qps"):
+                a, b = prev.get(key, 0.0), run.get(key, 0.0)
+                delta = (b - a) / a * 100 if a else 0.0
+                cells.append(f"{key} {a:.2f} -> {b:.2f} ({delta:+.1f}%)")
+            print(f"- {scenario} c={run['concurrency']}: " + " | ".join(cells))
+    a, b = old.get("ingest", {}).get("chunks_per_s"), new.get("ingest", {}).get("chunks_per_s")
+    if a and b:
+        print(f"- ingest chunks/s: {a:.2f} -> {b:.2f} ({(b - a) / a * 100:+.1f}%)")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark de ingesta, search() y generate_text (LLM simulado)")
+    ap.add_argument("--corpus", type=Path, default=Path("data_txt"), help="Directorio con .txt a ingerir")
+    ap.add_argument("--synthetic-docs", type=int, default=0, help="Usa N documentos sintéticos en vez de --corpus")
+    ap.add_argument("--synthetic-paragraphs", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--queries", type=Path, default=None, help=".json (lista) o .txt (una por línea)")
+    ap.add_argument("--requests", type=int, default=64, help="Llamadas por nivel de concurrencia")
+    ap.add_argument("--concurrency", default="1,4,8", help="Niveles de concurrencia, separados por coma")
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latencia simulada del LLM")
+    ap.add_argument("--with-cache", action="store_true",
+                    help="Mantiene las cachés de embeddings/resultados (por defecto se desactivan)")
+    ap.add_argument("--model", default=None, help="EMBEDDING_MODEL a usar (por defecto el de bd.embeddings)")
+    ap.add_argument("--backend", default=None, help="EMBEDDING_BACKEND (sentence-transformers, torch-int8, onnx)")
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=0, help="Procesos de embeddings en la ingesta")
+    ap.add_argument("--skip-generate", action="store_true")
+    ap.add_argument("--keep-dir", action="store_true", help="No borra el CHROMA_DIR temporal")
+    ap.add_argument("--out", type=Path, default=Path("benchmark_results.json"))
+    ap.add_argument("--compare", type=Path, default=None, help="JSON previo para comparar")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    corpus_dir = workdir / "corpus"
+    corpus_dir.mkdir()
+
+    # Debe fijarse ANTES de importar bd.chroma_store (rutas y cachés se leen al importar)
+    os.environ["CHROMA_DIR"] = str(workdir / "chroma_db")
+    if args.model:
+        os.environ["EMBEDDING_MODEL"] = args.model
+    if args.backend:
+        os.environ["EMBEDDING_BACKEND"] = args.backend
+    if not args.with_cache:
+        for var in ("QUERY_EMB_CACHE_SIZE", "RESULT_CACHE_SIZE", "ANSWER_CACHE_SIZE"):
+            os.environ[var] = "0"
+        os.environ.pop("QUERY_EMB_CACHE_PATH", None)
+    os.environ.pop("MEMORY_DB_PATH", None)
+
+    from bd import chroma_store
+    from bd.embed_pool import EmbeddingPool
+    from bd.manifest import Manifest
+    from ingest_chroma import ingest_stream
+    import ai.chat as chat
+
+    try:
+        if args.synthetic_docs:
+            paths = write_synthetic_corpus(corpus_dir, args.synthetic_docs, args.synthetic_paragraphs, args.seed)
+        else:
+            paths = copy_corpus(args.corpus, corpus_dir)
+        if not paths:
+            raise SystemExit(f"No hay .txt en: {args.corpus.resolve()}")
+        queries = load_queries(args.queries)
+
+        print("CHROMA_DIR temporal:", chroma_store.CHROMA_DIR)
+        results: Dict[str, Any] = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                "embedding_model": chroma_store.EMBEDDING_MODEL,
+                "embedding_backend": chroma_store.DEFAULT_CONFIG.backend,
+                "embed_batch_max_size": chroma_store.EMBED_BATCH_MAX_SIZE,
+                "embed_batch_wait_ms": chroma_store.EMBED_BATCH_WAIT_MS,
+                "corpus": "synthetic" if args.synthetic_docs else str(args.corpus),
+                "docs": len(paths),
+                "queries": len(queries),
+                "requests": args.requests,
+                "top_k": args.top_k,
+                "llm_latency_ms": args.llm_latency_ms,
+                "with_cache": args.with_cache,
+                "batch_size": args.batch_size,
+                "workers": args.workers,
+            },
+        }
+
+        # 1) Carga del modelo (aparte, para no mezclarla con la ingesta)
+        t0 = time.perf_counter()
+        chroma_store.warmup()
+        results["warmup_s"] = round(time.perf_counter() - t0, 3)
+        results["rss_after_warmup_mb"] = peak_rss_mb()
+
+        # 2) Ingesta
+        from bd.chunking import DEFAULT_STRATEGY, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+
+        manifest = Manifest(workdir / "chroma_manifest.json")
+        pool = EmbeddingPool(args.workers) if args.workers > 0 else None
+        t0 = time.perf_counter()
+        try:
+            progress = ingest_stream(
+                paths, manifest,
+                strategy=DEFAULT_STRATEGY, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP,
+                batch_size=args.batch_size, pool=pool,
+            )
+        finally:
+            if pool is not None:
+                pool.close()
+        dt = max(time.perf_counter() - t0, 1e-9)
+        results["ingest"] = {
+            "docs": progress.docs,
+            "chunks": progress.chunks,
+            "seconds": round(dt, 3),
+            "docs_per_s": round(progress.docs / dt, 3),
+            "chunks_per_s": round(progress.chunks / dt, 3),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+        # 3) search()
+        results["search"] = []
+        for c in levels:
+            run = run_load(lambda q: chroma_store.search(q, top_k=args.top_k), queries, c, args.requests)
+            run["peak_rss_mb"] = peak_rss_mb()
+            results["search"].append(run)
+            print(f"search c={c}: p50 {run['p50_ms']} ms | p95 {run['p95_ms']} ms | {run['qps']} qps")
+
+        # 4) generate_text con LLM simulado (sin red)
+        if not args.skip_generate:
+            def fake_llm(prompt_rendered, model="gpt-4o-mini"):
+                with chat.span("llm"):
+                    if args.llm_latency_ms:
+                        time.sleep(args.llm_latency_ms / 1000.0)
+                return "respuesta simulada"
+
+            chat._answer_with_llm = fake_llm
+            results["generate_text"] = []
+            for c in levels:
+                run = run_load(
+                    lambda q: chat.generate_text(q, None, use_llm=True, top_k=args.top_k, use_cache=args.with_cache),
+                    queries, c, args.requests,
+                )
+                run["peak_rss_mb"] = peak_rss_mb()
+                results["generate_text"].append(run)
+                print(f"generate_text c={c}: p50 {run['p50_ms']} ms | p95 {run['p95_ms']} ms | {run['qps']} qps")
+
+        results["peak_rss_mb"] = peak_rss_mb()
+        results["cache_stats"] = chroma_store.cache_stats()
+        results["microbatch"] = chroma_store.embedding_info()["microbatch"]
+
+        args.out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print("Resultados en:", args.out)
+
+        if args.compare:
+            compare(json.loads(args.compare.read_text(encoding="utf-8")), results)
+    finally:
+        if args.keep_dir:
+            print("Directorio conservado:", workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# evaluate_retrieval.py
+# Calidad de retrieval (recall@k, MRR, nDCG@k) junto a latencia y memoria.
+#
+# Toma un set etiquetado [{"question": ..., "relevant": [ids]}] y lo corre por
+# bd.chroma_store.search() con varias configuraciones (modo x top_k x distance_threshold).
+# Un id relevante puede ser el id del chunk, su parent_id (nombre del .txt sin
+# extensión) o el `source`. Cada modelo se evalúa en su propio proceso, sobre
+# un CHROMA_DIR temporal con el corpus ingerido con ESE modelo. Un modelo puede
+# llevar prefijo de backend ("torch-int8:<modelo>", "onnx:<modelo>"):
+#
+#   python evaluate_retrieval.py --top-k 3,5,10 --thresholds 0.5,none
+#   python evaluate_retrieval.py --models BAAI/bge-large-en-v1.5,onnx:sentence-transformers/all-MiniLM-L6-v2
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from benchmark import copy_corpus, git_commit, latency_summary, peak_rss_mb
+
+DEFAULT_QRELS = Path("data_eval") / "retrieval_qrels.json"
+
+
+def load_qrels(path: Path) -> List[Dict[str, Any]]:
+    items = json.loads(path.read_text(encoding="utf-8"))
+    out = []
+    for it in items:
+        relevant = it.get("relevant") or []
+        if isinstance(relevant, str):
+            relevant = [relevant]
+        if not it.get("question") or not relevant:
+            raise ValueError(f"Entrada inválida en {path}: {it}")
+        out.append({"question": it["question"], "relevant": [str(r) for r in relevant]})
+    return out
+
+
+def hit_keys(hit: Dict[str, Any]) -> Set[str]:
+    """
+    Identificadores con los que un hit puede calzar con una etiqueta.
+    """
+    meta = hit.get("metadata") or {}
+    keys = {str(hit.get("id", ""))}
+    if meta.get("parent_id"):
+        keys.add(str(meta["parent_id"]))
+    source = meta.get("source")
+    if source:
+        keys.update({str(source), Path(source).name, Path(source).stem})
+    return keys
+
+
+def ranked_labels(hits: List[Dict[str, Any]], relevant: List[str]) -> List[Optional[str]]:
+    """
+    Por cada posición del ranking, la etiqueta relevante que cubre (o None).
+    Una etiqueta solo cuenta la primera vez: varios chunks del mismo
+    documento no inflan recall ni nDCG.
+    """
+    seen: Set[str] = set()
+    out: List[Optional[str]] = []
+    for h in hits:
+        match = next((r for r in relevant if r in hit_keys(h) and r not in seen), None)
+        if match is not None:
+            seen.add(match)
+        out.append(match)
+    return out
+
+
+def recall_at_k(labels: List[Optional[str]], relevant: List[str], k: int) -> float:
+    found = {lab for lab in labels[:k] if lab is not None}
+    return len(found) / len(set(relevant))
+
+
+def reciprocal_rank(labels: List[Optional[str]], k: int) -> float:
+    for i, lab in enumerate(labels[:k], 1):
+        if lab is not None:
+            return 1.0 / i
+    return 0.0
+
+
+def ndcg_at_k(labels: List[Optional[str]], relevant: List[str], k: int) -> float:
+    dcg = sum(1.0 / math.log2(i + 1) for i, lab in enumerate(labels[:k], 1) if lab is not None)
+    ideal = sum(1.0 / math.log2(i + 1) for i in range(1, min(len(set(relevant)), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+def parse_threshold(value: str) -> Optional[float]:
+    return None if value.strip().lower() in ("none", "off", "") else float(value)
+
+
+def evaluate_config(
+    search,
+    qrels: List[Dict[str, Any]],
+    top_k: int,
+    threshold: Optional[float],
+    mode: Optional[str] = None,
+    rerank: bool = False,
+) -> Dict[str, Any]:
+    recalls, rrs, ndcgs, latencies, n_hits = [], [], [], [], []
+    for item in qrels:
+        t0 = time.perf_counter()
+        hits = search(item["question"], top_k=top_k, distance_threshold=threshold, mode=mode, rerank=rerank)
+        latencies.append(time.perf_counter() - t0)
+        labels = ranked_labels(hits, item["relevant"])
+        recalls.append(recall_at_k(labels, item["relevant"], top_k))
+        rrs.append(reciprocal_rank(labels, top_k))
+        ndcgs.append(ndcg_at_k(labels, item["relevant"], top_k))
+        n_hits.append(len(hits))
+
+    n = len(qrels)
+    out: Dict[str, Any] = {
+        "mode": mode,
+        "rerank": rerank,
+        "top_k": top_k,
+        "distance_threshold": threshold,
+        "recall@k": round(sum(recalls) / n, 4),
+        "mrr": round(sum(rrs) / n, 4),
+        "ndcg@k": round(sum(ndcgs) / n, 4),
+        "avg_hits": round(sum(n_hits) / n, 2),
+    }
+    out["latency"] = latency_summary(latencies)
+    return out
+
+
+def evaluate_model(args) -> Dict[str, Any]:
+    """
+    Ingiere el corpus con el modelo actual (EMBEDDING_MODEL) y evalúa la grilla.
+    """
+    workdir = Path(tempfile.mkdtemp(prefix="rag_eval_"))
+    corpus_dir = workdir / "corpus"
+    corpus_dir.mkdir()
+
+    # Antes de importar bd.chroma_store; sin cachés para medir latencia real
+    os.environ["CHROMA_DIR"] = str(workdir / "chroma_db")
+    # (no se importa bd.embeddings antes: lee estas variables al importarse)
+    if args.model:
+        backend, sep, model = args.model.partition(":")
+        if sep:
+            os.environ["EMBEDDING_BACKEND"] = backend
+        else:
+            model = args.model
+        os.environ["EMBEDDING_MODEL"] = model
+    for var in ("QUERY_EMB_CACHE_SIZE", "RESULT_CACHE_SIZE"):
+        os.environ[var] = "0"
+    os.environ.pop("QUERY_EMB_CACHE_PATH", None)
+    if args.rerank_model:
+        os.environ["RERANK_MODEL"] = args.rerank_model
+
+    from bd import chroma_store
+    from bd.chunking import DEFAULT_STRATEGY, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+    from bd.manifest import Manifest
+    from ingest_chroma import ingest_stream
+
+    try:
+        paths = copy_corpus(args.corpus, corpus_dir)
+        if not paths:
+            raise SystemExit(f"No hay .txt en: {args.corpus.resolve()}")
+        qrels = load_qrels(args.qrels)
+
+        t0 = time.perf_counter()
+        chroma_store.warmup()
+        warmup_s = time.perf_counter() - t0
+        rss_model = peak_rss_mb()
+
+        t0 = time.perf_counter()
+        progress = ingest_stream(
+            paths, Manifest(workdir / "chroma_manifest.json"),
+            strategy=DEFAULT_STRATEGY, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP,
+        )
+        ingest_s = time.perf_counter() - t0
+
+        configs = []
+        grid = [
+            (mode.strip(), rerank, int(k), parse_threshold(th))
+            for mode in args.modes.split(",") if mode.strip()
+            for rerank in ((False, True) if args.rerank_model else (False,))
+            for k in args.top_k.split(",") if k.strip()
+            for th in args.thresholds.split(",")
+        ]
+        for mode, rerank, k, th in grid:
+            res = evaluate_config(chroma_store.search, qrels, k, th, mode=mode, rerank=rerank)
+            configs.append(res)
+            print(
+                f"{chroma_store.EMBEDDING_KEY} {mode}{' +rerank' if rerank else ''} k={k} th={th}: recall@k {res['recall@k']} | "
+                f"MRR {res['mrr']} | nDCG@k {res['ndcg@k']} | p50 {res['latency']['p50_ms']} ms"
+            )
+
+        return {
+            "embedding_model": chroma_store.EMBEDDING_MODEL,
+            "embedding_backend": chroma_store.DEFAULT_CONFIG.backend,
+            "questions": len(qrels),
+            "chunks": progress.chunks,
+            "warmup_s": round(warmup_s, 3),
+            "ingest_s": round(ingest_s, 3),
+            "rss_after_warmup_mb": rss_model,
+            "peak_rss_mb": peak_rss_mb(),
+            "rerank_model": args.rerank_model,
+            "configs": configs,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Evaluación de calidad de retrieval (recall@k, MRR, nDCG) + latencia")
+    ap.add_argument("--qrels", type=Path, default=DEFAULT_QRELS, help="JSON [{question, relevant: [ids]}]")
+    ap.add_argument("--corpus", type=Path, default=Path("data_txt"))
+    ap.add_argument("--modes", default="hybrid,vector", help="RETRIEVAL_MODE a comparar (hybrid, vector, keyword)")
+    ap.add_argument("--top-k", default="1,3,5", help="Valores de top_k, separados por coma")
+    ap.add_argument("--thresholds", default="0.5,none", help="distance_threshold, separados por coma ('none' = sin corte)")
+    ap.add_argument("--rerank-model", default=None, help="Cross-encoder: evalúa cada configuración con y sin reranking")
+    ap.add_argument("--model", default=None, help="Un EMBEDDING_MODEL, opcionalmente '<backend>:<modelo>'")
+    ap.add_argument("--models", default=None, help="Varios modelos separados por coma (un proceso por modelo)")
+    ap.add_argument("--out", type=Path, default=Path("eval_results.json"))
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    models = [m.strip() for m in (args.models or "").split(",") if m.strip()]
+
+    if len(models) > 1:
+        # Un proceso por modelo: el modelo se fija al importar y la RSS queda aislada
+        runs = []
+        for m in models:
+            out = Path(tempfile.mkstemp(suffix=".json")[1])
+            cmd = [
+                sys.executable, str(Path(__file__).resolve()),
+                "--qrels", str(args.qrels), "--corpus", str(args.corpus),
+                "--modes", args.modes, "--top-k", args.top_k, "--thresholds", args.thresholds,
+                "--model", m, "--out", str(out),
+            ]
+            if args.rerank_model:
+                cmd += ["--rerank-model", args.rerank_model]
+            try:
+                subprocess.run(cmd, check=True)
+                runs.extend(json.loads(out.read_text(encoding="utf-8"))["runs"])
+            finally:
+                out.unlink(missing_ok=True)
+    else:
+        if models:
+            args.model = models[0]
+        runs = [evaluate_model(args)]
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "qrels": str(args.qrels),
+        "runs": runs,
+    }
+    args.out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print("Resultados en:", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,285 @@
+import argparse
+import os
+import time
+from collections import deque
 from pathlib import Path
-from bd.chroma_store import upsert_docs, count, debug_collections, CHROMA_DIR
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bd.chroma_store import upsert_docs, delete_docs, count, debug_collections, CHROMA_DIR, EMBEDDING_KEY
+from bd.chroma_store import rebuild_keyword_index, get_store, COLLECTION_NAME
+from bd.chunking import chunk_text, STRATEGIES, DEFAULT_STRATEGY, DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP, CHUNKING_VERSION
+from bd.doc_metadata import derive_metadata, METADATA_VERSION
+from bd.manifest import Manifest, manifest_path, file_sha256
+from bd.embed_pool import EmbeddingPool
 
 DATA_DIR = Path("data_txt")
+DEFAULT_BATCH_SIZE = 64
+
+
+def chunk_id(parent_id: str, index: int) -> str:
+    return f"{parent_id}#{index:04d}"
+
+
+def build_chunks(
+    path: Path,
+    strategy: str = DEFAULT_STRATEGY,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overlap: int = DEFAULT_OVERLAP,
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """
+    Lee un .txt y lo divide en chunks; cada chunk guarda su archivo padre,
+    offsets y la metadata del documento (área, tipo, fecha) para filtrar.
+    """
+    text = path.read_text(encoding="utf-8", errors="ignore")
+    parent_id = path.stem
+    doc_meta = derive_metadata(path, text)
+
+    ids, texts, metas = [], [], []
+    for c in chunk_text(text, strategy=strategy, chunk_size=chunk_size, overlap=overlap):
+        ids.append(chunk_id(parent_id, c.index))
+        texts.append(c.text)
+        metas.append({
+            "source": str(path),
+            "parent_id": parent_id,
+            "chunk_index": c.index,
+            "char_start": c.start,
+            "char_end": c.end,
+            "chunk_strategy": strategy,
+            **doc_meta,
+        })
+    return ids, texts, metas
+
+
+def iter_file_chunks(
+    paths: Iterable[Path],
+    strategy: str,
+    chunk_size: int,
+    overlap: int,
+) -> Iterator[Tuple[Path, str, List[str], List[str], List[Dict[str, Any]]]]:
+    """
+    Generador: lee y trocea los archivos de a uno (memoria acotada).
+    Un archivo ilegible se informa y se salta, sin abortar la ingesta.
+    """
+    for p in paths:
+        try:
+            sha = file_sha256(p)
+            ids, texts, metas = build_chunks(p, strategy, chunk_size, overlap)
+        except (OSError, ValueError) as e:
+            print(f"- {p.name}: ERROR al leer/trocear ({e}); se omite")
+            continue
+        yield p, sha, ids, texts, metas
+
+
+def chunking_params(strategy: str, chunk_size: int, overlap: int) -> Dict[str, Any]:
+    """
+    Parámetros con que se troceó un archivo (se guardan en el manifiesto): si
+    cambian, o cambian los cortes (CHUNKING_VERSION) o las reglas de metadata,
+    los chunks previos quedan obsoletos.
+    """
+    return {
+        "strategy": strategy, "chunk_size": chunk_size, "overlap": overlap,
+        "version": CHUNKING_VERSION, "metadata": METADATA_VERSION,
+    }
+
+
+class Progress:
+    """
+    Contador de avance y throughput (docs/s, chunks/s) de la ingesta.
+    """
+
+    def __init__(self, total_docs: int):
+        self.total_docs = total_docs
+        self.docs = 0
+        self.chunks = 0
+        self.batches = 0
+        self.t0 = time.perf_counter()
+
+    def report(self) -> None:
+        dt = max(time.perf_counter() - self.t0, 1e-9)
+        print(
+            f"[batch {self.batches}] docs {self.docs}/{self.total_docs} | chunks {self.chunks} | "
+            f"{self.docs / dt:.2f} docs/s | {self.chunks / dt:.2f} chunks/s"
+        )
+
+
+def ingest_stream(
+    paths: List[Path],
+    manifest: Manifest,
+    *,
+    strategy: str,
+    chunk_size: int,
+    overlap: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    pool: Optional[EmbeddingPool] = None,
+    collection: Optional[str] = None,
+) -> Progress:
+    """
+    Embebe y hace upsert por lotes de `batch_size` chunks.
+
+    Un archivo se registra en el manifiesto solo cuando TODOS sus chunks
+    quedaron en lotes ya confirmados; mientras tanto, cada lote confirmado
+    anota sus chunk ids en el avance parcial del archivo (Manifest.partial).
+    Tras un crash, la siguiente corrida salta los chunks ya confirmados (si
+    el archivo y el chunking no cambiaron) y retoma desde el último lote
+    confirmado (los ids son deterministas y el upsert es idempotente).
+
+    Con `pool`, los embeddings se calculan en paralelo en otros procesos
+    (hasta 2 lotes en vuelo por worker) y se confirman en orden.
+
+    `collection` (None = COLLECTION_NAME) se crea si no existe.
+    """
+    progress = Progress(total_docs=len(paths))
+    chunking = chunking_params(strategy, chunk_size, overlap)
+    batch_ids: List[str] = []
+    batch_texts: List[str] = []
+    batch_metas: List[Dict[str, Any]] = []
+    # Archivo (path, sha256) de cada chunk del lote, para el avance parcial
+    batch_files: List[Tuple[Path, str]] = []
+    # Archivos con chunks en el lote actual, pendientes de registrar
+    pending: List[Tuple[Path, str, List[str]]] = []
+    # Lotes enviados al pool, en orden de confirmación
+    in_flight: deque = deque()
+    max_in_flight = 2 * pool.workers if pool else 0
+
+    def commit(ids, texts, metas, owners, files, embeddings=None) -> None:
+        if ids:
+            upsert_docs(ids, texts, metas, embeddings=embeddings, collection=collection)
+            progress.chunks += len(ids)
+            progress.batches += 1
+        done = {str(p) for p, _, _ in files}
+        parts: Dict[str, Tuple[Path, str, List[str]]] = {}
+        for chunk, (p, sha) in zip(ids, owners):
+            if str(p) not in done:
+                parts.setdefault(str(p), (p, sha, []))[2].append(chunk)
+        for p, sha, chunk_ids in parts.values():
+            manifest.record_partial(p, chunk_ids, sha, chunking=chunking)
+        for p, sha, chunk_ids in files:
+            manifest.record(p, p.stem, chunk_ids, sha256=sha, chunking=chunking)
+            progress.docs += 1
+        manifest.save()
+        progress.report()
+
+    def drain(limit: int) -> None:
+        while len(in_flight) > limit:
+            future, batch = in_flight.popleft()
+            commit(*batch, embeddings=future.result())
+
+    def flush() -> None:
+        batch = (list(batch_ids), list(batch_texts), list(batch_metas), list(batch_files), list(pending))
+        batch_ids.clear()
+        batch_texts.clear()
+        batch_metas.clear()
+        batch_files.clear()
+        pending.clear()
+        if pool is None or not batch[0]:
+            drain(0)
+            commit(*batch)
+        else:
+            in_flight.append((pool.submit(batch[1]), batch))
+            drain(max_in_flight)
+
+    for p, sha, ids, texts, metas in iter_file_chunks(paths, strategy, chunk_size, overlap):
+        source = str(p)
+
+        # Chunks que ya no existen (archivo más corto) o doc "archivo completo" legado
+        old_ids = set(manifest.chunk_ids(source)) - set(ids)
+        committed = set(manifest.committed_chunk_ids(p, sha, chunking))
+        if committed:
+            print(f"- {p.name}: se retoma ({len(committed)}/{len(ids)} chunks ya confirmados)")
+        elif source not in manifest.sources:
+            # Sin avance parcial válido: fuera cualquier chunk previo del archivo
+            delete_docs(where={"parent_id": p.stem}, collection=collection)
+            old_ids.add(p.stem)
+        delete_docs(ids=sorted(old_ids), collection=collection)
+
+        for i in range(len(ids)):
+            if ids[i] in committed:
+                continue
+            batch_ids.append(ids[i])
+            batch_texts.append(texts[i])
+            batch_metas.append(metas[i])
+            batch_files.append((p, sha))
+            if len(batch_ids) >= batch_size:
+                flush()
+        pending.append((p, sha, ids))
+
+    flush()
+    drain(0)
+    return progress
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Ingesta de data_txt/*.txt en Chroma (por chunks)")
+    ap.add_argument("--strategy", choices=STRATEGIES, default=os.getenv("CHUNK_STRATEGY", DEFAULT_STRATEGY))
+    ap.add_argument("--chunk-size", type=int, default=int(os.getenv("CHUNK_SIZE", DEFAULT_CHUNK_SIZE)))
+    ap.add_argument("--overlap", type=int, default=int(os.getenv("CHUNK_OVERLAP", DEFAULT_OVERLAP)))
+    ap.add_argument("--collection", default=os.getenv("INGEST_COLLECTION", COLLECTION_NAME),
+                    help="Colección destino (se crea si no existe)")
+    ap.add_argument("--data-dir", type=Path, default=DATA_DIR)
+    ap.add_argument("--manifest", type=Path, default=None,
+                    help="Por defecto, el manifiesto de la colección (al lado de chroma_db/)")
+    ap.add_argument("--force", action="store_true", help="Re-embebe todo, ignorando el manifiesto")
+    ap.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", 0)),
+                    help="Procesos para embeddings (0 = embebe Chroma en este proceso)")
+    ap.add_argument("--torch-threads", type=int, default=int(os.getenv("INGEST_TORCH_THREADS", 0)) or None,
+                    help="Threads de torch por worker (por defecto: los de torch)")
+    ap.add_argument("--rebuild-keyword-index", action="store_true",
+                    help="Reconstruye el índice BM25 desde la colección (colecciones previas al índice)")
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
 
-def main():
     print("Usando CHROMA_DIR:", CHROMA_DIR)
+    print("Modelo de embeddings:", EMBEDDING_KEY)
     print("Colecciones antes:", debug_collections())
-    print("Count antes:", count())
+    # Abrir la colección no carga el modelo: con --workers los vectores vienen
+    # del pool y este proceso nunca lo carga (sin workers, en el primer upsert)
+    get_store(args.collection, create=True)
+    print(f"Count antes ({args.collection}):", count(args.collection))
 
-    paths = sorted(DATA_DIR.glob("*.txt"))
+    paths = sorted(args.data_dir.glob("*.txt"))
     if not paths:
-        raise SystemExit(f"No hay .txt en: {DATA_DIR.resolve()}")
+        raise SystemExit(f"No hay .txt en: {args.data_dir.resolve()}")
+
+    manifest = Manifest.load(args.manifest or manifest_path(args.collection))
+    chunking = chunking_params(args.strategy, args.chunk_size, args.overlap)
+
+    # 1) Fuentes borradas del disco (o a medio ingerir) -> borrar sus chunks huérfanos
+    current = {str(p) for p in paths}
+    for source in [s for s in {**manifest.sources, **manifest.partial} if s not in current]:
+        stale = manifest.forget(source)
+        delete_docs(ids=stale, collection=args.collection)
+        print(f"- {source}: eliminado ({len(stale)} chunks)")
+
+    # 2) Solo se embeben archivos nuevos o modificados, en streaming y por lotes
+    changed = [p for p in paths if args.force or not manifest.is_unchanged(p, chunking)]
+    skipped = len(paths) - len(changed)
 
-    ids = [p.stem for p in paths]
-    texts = [p.read_text(encoding="utf-8", errors="ignore") for p in paths]
-    metas = [{"source": str(p)} for p in paths]
+    pool = EmbeddingPool(args.workers, args.torch_threads) if args.workers > 0 and changed else None
+    try:
+        ingest_stream(
+            changed,
+            manifest,
+            strategy=args.strategy,
+            chunk_size=args.chunk_size,
+            overlap=args.overlap,
+            batch_size=args.batch_size,
+            pool=pool,
+            collection=args.collection,
+        )
+    finally:
+        if pool is not None:
+            pool.close()
+    print(f"Sin cambios: {skipped} archivo(s)")
 
-    upsert_docs(ids, texts, metas)
+    if args.rebuild_keyword_index:
+        print("Índice BM25 reconstruido:", rebuild_keyword_index(args.collection), "chunks")
 
     print("Colecciones después:", debug_collections())
-    print("Count después:", count())
+    print(f"Count después ({args.collection}):", count(args.collection))
 
 if __name__ == "__main__":
     main()
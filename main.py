@@ -3,24 +3,30 @@
 # - No revienta si no hay gpt_key: /messages funcionará igual si el generate_text no depende de OpenAI
 
 
-from openai import OpenAI
+import asyncio
+import json
+import os
+import threading
+import time
+
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Body, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 
-import config
-from ai.chat import generate_text
+import metrics
+from ai.chat import agenerate_text, astream_text, answer_cache_stats, memory_stats, forget_chat
+from ai.chat import RagPipeline
+from ai.llm_client import aclose_clients
+from ai.context import DEFAULT_CONTEXT_TOKENS
 
 # Chroma local (persistente) -> tu módulo bd/chroma_store.py
-from bd.chroma_store import search as chroma_search
-
-# -------------------------
-# OpenAI client
-# -------------------------
-# Si no hay gpt_key, dejar config.gpt_key vacío y no se usará acá directamente.
-client = OpenAI(api_key=getattr(config, "gpt_key", None))
+from bd.chroma_store import asearch as chroma_asearch, asearch_many as chroma_asearch_many
+from bd.chroma_store import warmup as chroma_warmup, is_ready as chroma_is_ready
+from bd.chroma_store import cache_stats, embedding_info, RETRIEVAL_MODES
+from bd.chroma_store import CollectionNotFound, COLLECTION_NAME, debug_collections, get_store
+from bd.doc_metadata import to_chroma_where
 
 app = FastAPI()
 
@@ -34,6 +40,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# -------------------------
+# Métricas (Prometheus)
+# -------------------------
+HTTP_IN_FLIGHT = metrics.Gauge("http_requests_in_flight", "Requests HTTP en curso (streaming: hasta enviar headers)")
+HTTP_SECONDS = metrics.Histogram("http_request_seconds", "Latencia de requests HTTP (hasta headers)", ["path", "status"])
+CACHE_HITS = metrics.Gauge("rag_cache_hits", "Hits acumulados por caché", ["cache"])
+CACHE_MISSES = metrics.Gauge("rag_cache_misses", "Misses acumulados por caché", ["cache"])
+CACHE_HIT_RATE = metrics.Gauge("rag_cache_hit_rate", "Hit rate por caché (0-1)", ["cache"])
+CACHE_SIZE = metrics.Gauge("rag_cache_size", "Entradas actuales por caché", ["cache"])
+
+
+def _collect_cache_metrics():
+    all_stats = {**cache_stats(), "answers": answer_cache_stats()}
+    for name, st in all_stats.items():
+        CACHE_HITS.set(st.get("hits", 0), cache=name)
+        CACHE_MISSES.set(st.get("misses", 0), cache=name)
+        CACHE_HIT_RATE.set(st.get("hit_rate", 0.0), cache=name)
+        CACHE_SIZE.set(st.get("size", 0), cache=name)
+
+metrics.add_pre_render_hook(_collect_cache_metrics)
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    HTTP_IN_FLIGHT.inc()
+    t0 = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        # Se etiqueta por la plantilla de la ruta (ej. /chats/{chat_id}) para acotar cardinalidad
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        HTTP_SECONDS.observe(time.perf_counter() - t0, path=path, status=status)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # -------------------------
 # Health / Root
 # -------------------------
@@ -41,82 +90,199 @@ app.add_middleware(
 async def init():
     return "hi"
 
+# Liveness: responde apenas el proceso está arriba (no toca modelo ni Chroma).
 @app.get("/health")
+@app.get("/health/live")
 def health():
     return {"status": "ok"}
 
+# Readiness: 503 hasta que el modelo de embeddings y la colección estén cargados.
+@app.get("/health/ready")
+def health_ready():
+    if not chroma_is_ready():
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready", "embedding": embedding_info()}
+
+@app.get("/cache/stats")
+def cache_stats_endpoint():
+    return {**cache_stats(), "answers": answer_cache_stats(), "memory": memory_stats()}
+
+# -------------------------
+# Warm-up
+# -------------------------
+# Carga el modelo en segundo plano para que el pod arranque rápido y
+# /health/ready pase a 200 solo cuando el modelo esté realmente cargado.
+# WARMUP_ON_STARTUP=0 lo desactiva (la carga ocurre en la primera consulta).
+def _warmup():
+    try:
+        chroma_warmup()
+    except Exception as e:
+        print("Error en warmup:", e)
+
+@app.on_event("startup")
+def startup_warmup():
+    if os.getenv("WARMUP_ON_STARTUP", "1") != "0":
+        threading.Thread(target=_warmup, name="chroma-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_llm_clients():
+    await aclose_clients()
+
+@app.get("/collections")
+def collections_endpoint():
+    """
+    Colecciones disponibles (elegibles con "collection" en /search, /rag_debug y /messages).
+    """
+    return {"default": COLLECTION_NAME, "collections": debug_collections(), "open": cache_stats()["collections"]["open"]}
+
 # -------------------------
 # Retrieval endpoints
 # -------------------------
+def _client_error(e: ValueError) -> JSONResponse:
+    # Colección inexistente -> 404; parámetros inválidos (mode, filters...) -> 400
+    status = 404 if isinstance(e, CollectionNotFound) else 400
+    return JSONResponse(status_code=status, content={"error": str(e)})
+
 @app.post("/search")
-def search_endpoint(payload: dict = Body(...)):
+async def search_endpoint(payload: dict = Body(...)):
     """
     Entrada esperada:
     {
       "query": "texto ...",
-      "top_k": 3
+      "top_k": 3,
+      "mode": "hybrid",         (opcional: hybrid | vector | keyword)
+      "rerank": true,           (opcional; por defecto activo si hay RERANK_MODEL)
+      "filters": {"area": "flotacion", "doc_type": "manual", "date_from": "2024-01-01"}   (opcional)
+      "collection": "kb_planta_norte"   (opcional; por defecto la colección principal)
     }
 
     Salida:
     {
       "query": "...",
       "top_k": 3,
-      "hits": [ {id,text,metadata,distance}, ...]
+      "hits": [ {id,text,metadata,distance[,score,bm25,rerank_score]}, ...]
     }
     """
     query = payload.get("query", "")
     top_k = int(payload.get("top_k", 3))
+    mode = payload.get("mode") or None
+    rerank = payload.get("rerank")
+    filters = payload.get("filters") or None
+    collection = payload.get("collection") or None
+
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        return JSONResponse(status_code=400, content={"error": f"'mode' debe ser uno de {list(RETRIEVAL_MODES)}"})
 
     try:
-        hits = chroma_search(query, top_k=top_k)
+        hits = await chroma_asearch(
+            query, top_k=top_k, mode=mode, rerank=rerank, filters=filters, collection=collection
+        )
         return {"query": query, "top_k": top_k, "hits": hits}
+    except ValueError as e:
+        return _client_error(e)
     except Exception as e:
         print(e)
         return JSONResponse(status_code=500, content={"error": f"Error en /search: {str(e)}"})
 
 
+# Límite de consultas por request en /search/batch
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "256"))
+
+@app.post("/search/batch")
+async def search_batch_endpoint(payload: dict = Body(...)):
+    """
+    Entrada esperada:
+    {
+      "queries": ["texto 1", "texto 2", ...],
+      "top_k": 3,
+      "mode": "hybrid",         (opcional)
+      "rerank": true,           (opcional)
+      "filters": {...},         (opcional, igual que /search)
+      "collection": "..."       (opcional, igual que /search)
+    }
+
+    Salida:
+    {
+      "top_k": 3,
+      "results": [ {"query": "...", "hits": [...]}, ...]
+    }
+    """
+    queries = payload.get("queries") or []
+    top_k = int(payload.get("top_k", 3))
+    mode = payload.get("mode") or None
+    rerank = payload.get("rerank")
+    filters = payload.get("filters") or None
+    collection = payload.get("collection") or None
+
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        return JSONResponse(status_code=400, content={"error": f"'mode' debe ser uno de {list(RETRIEVAL_MODES)}"})
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return JSONResponse(status_code=400, content={"error": "'queries' debe ser una lista de strings"})
+    if len(queries) > MAX_BATCH_QUERIES:
+        return JSONResponse(status_code=400, content={"error": f"Máximo {MAX_BATCH_QUERIES} queries por request"})
+
+    try:
+        results = await chroma_asearch_many(
+            queries, top_k=top_k, mode=mode, rerank=rerank, filters=filters, collection=collection
+        ) if queries else []
+        return {
+            "top_k": top_k,
+            "results": [{"query": q, "hits": hits} for q, hits in zip(queries, results)],
+        }
+    except ValueError as e:
+        return _client_error(e)
+    except Exception as e:
+        print(e)
+        return JSONResponse(status_code=500, content={"error": f"Error en /search/batch: {str(e)}"})
+
+
 @app.post("/rag_debug")
-def rag_debug_endpoint(payload: dict = Body(...)):
+async def rag_debug_endpoint(payload: dict = Body(...)):
     """
     Entrada esperada:
     {
       "query": "texto ...",
       "top_k": 3,
-      "max_chars": 2500
+      "max_tokens": 1500,     (presupuesto de tokens del contexto)
+      "max_chars": 2500,      (opcional: tope de caracteres por documento)
+      "filters": {...},       (opcional, igual que /search)
+      "collection": "..."     (opcional, igual que /search)
     }
 
     Salida incluye:
     - hits (top-k)
     - context (texto concatenado para RAG, útil para modo)
+    - context_tokens (tokens usados por sección, presupuesto, descartados)
+    - prompt (SYSTEM + USER tal como se enviaría al LLM)
+
+    Usa el mismo RagPipeline que generate_text.
     """
     query = payload.get("query", "")
     top_k = int(payload.get("top_k", 3))
-    max_chars = int(payload.get("max_chars", 2500))
+    max_tokens = int(payload.get("max_tokens", DEFAULT_CONTEXT_TOKENS))
+    max_chars = payload.get("max_chars")
+    max_chars = int(max_chars) if max_chars else None
+    filters = payload.get("filters") or None
+    collection = payload.get("collection") or None
 
     try:
-        hits = chroma_search(query, top_k=top_k)
-
-        context_parts = []
-        for h in hits:
-            src = (h.get("metadata") or {}).get("source", "")
-            txt = (h.get("text") or "")[:max_chars]
-            dist = h.get("distance", None)
-            # dist puede venir None si no lo devuelve la implementación
-            dist_str = f"{dist:.4f}" if isinstance(dist, (int, float)) else str(dist)
-
-            context_parts.append(
-                f"[SOURCE: {src} | id={h.get('id')} | dist={dist_str}]\n{txt}"
-            )
-
-        context = "\n\n---\n\n".join(context_parts)
+        pipeline = RagPipeline(
+            top_k=top_k, max_chars_per_doc=max_chars, max_context_tokens=max_tokens, filters=filters,
+            collection=collection,
+        )
+        rag = await pipeline.aretrieve(query)
 
         return {
             "query": query,
             "top_k": top_k,
-            "hits": hits,
-            "context": context
+            "hits": rag.raw_hits,
+            "context": rag.context,
+            "context_tokens": rag.context_report,
+            "prompt": pipeline.render(query, rag),
         }
 
+    except ValueError as e:
+        return _client_error(e)
     except Exception as e:
         print(e)
         return JSONResponse(status_code=500, content={"error": f"Error en /rag_debug: {str(e)}"})
@@ -124,8 +290,26 @@ def rag_debug_endpoint(payload: dict = Body(...)):
 # -------------------------
 # Messages endpoint
 # -------------------------
+def _rag_params(payload: dict) -> dict:
+    """
+    Parámetros opcionales de retrieval en /messages y /messages/stream
+    (mismos nombres que en /rag_debug).
+    """
+    params = {}
+    if payload.get("top_k") is not None:
+        params["top_k"] = int(payload["top_k"])
+    if payload.get("max_tokens") is not None:
+        params["max_context_tokens"] = int(payload["max_tokens"])
+    if payload.get("max_chars"):
+        params["max_chars_per_doc"] = int(payload["max_chars"])
+    if payload.get("filters"):
+        params["filters"] = payload["filters"]
+    if payload.get("collection"):
+        params["collection"] = payload["collection"]
+    return params
+
 @app.post("/messages")
-def messages(payload: dict = Body(...)):
+async def messages(payload: dict = Body(...)):
     """
     Mantiene tu contrato actual:
     {
@@ -133,21 +317,35 @@ def messages(payload: dict = Body(...)):
       "message": {
         "chat": {"id": "..."},
         "text": "..."
-      }
+      },
+      "debug": false,    (opcional: true agrega hits/contexto/prompt/latencia)
+      "top_k": 3, "max_tokens": 1500, "max_chars": null,  (opcionales)
+      "filters": {"area": "flotacion"},                   (opcional, igual que /search)
+      "collection": "kb_planta_norte"                     (opcional, igual que /search)
     }
     """
     try:
         chat_id = payload["message"]["chat"]["id"]
         _type_app = payload.get("type", "web")
         message = payload["message"]["text"]
+        debug = bool(payload.get("debug", False))
 
         prompt = f"pregunta: {message}"
 
         # Función puede o no usar OpenAI internamente
-        response = generate_text(prompt, chat_id)
+        # "use_cache": false fuerza una respuesta nueva del LLM
+        response = await agenerate_text(
+            prompt, chat_id, use_cache=bool(payload.get("use_cache", True)), debug=debug,
+            **_rag_params(payload),
+        )
 
+        if debug:
+            # Mismo retrieval que generó la respuesta: no hace falta llamar a /rag_debug
+            return {"response": response["answer"], "debug": response}
         return {"response": response}
 
+    except ValueError as e:
+        return _client_error(e)
     except Exception as e:
         print(e)
         return JSONResponse(
@@ -155,5 +353,62 @@ def messages(payload: dict = Body(...)):
             content={"error": "Error interno del servidor"}
         )
 
+
+@app.delete("/chats/{chat_id}")
+def delete_chat(chat_id: str):
+    """
+    Borra la memoria de conversación de un chat_id.
+    """
+    forget_chat(chat_id)
+    return {"chat_id": chat_id, "status": "deleted"}
+
+
+@app.post("/messages/stream")
+async def messages_stream(payload: dict = Body(...)):
+    """
+    Mismo contrato de entrada que /messages, pero responde como
+    server-sent events (text/event-stream):
+
+    event: retrieval   -> hits y modo (llega antes de la primera palabra)
+    event: token       -> {"delta": "..."} por cada trozo generado
+    event: done        -> {"latency_s": ..., "ttft_s": ...}
+    event: error       -> {"error": "..."} si algo falla a mitad de camino
+    """
+    try:
+        chat_id = payload["message"]["chat"]["id"]
+        message = payload["message"]["text"]
+    except (KeyError, TypeError):
+        return JSONResponse(status_code=400, content={"error": "Payload inválido"})
+
+    prompt = f"pregunta: {message}"
+    try:
+        rag_params = _rag_params(payload)
+        # Errores del cliente antes de enviar los headers (luego solo queda "event: error")
+        to_chroma_where(rag_params.get("filters"))
+        # Abrir una colección puede cargar el modelo: fuera del event loop
+        await asyncio.to_thread(get_store, rag_params.get("collection"))
+    except ValueError as e:
+        return _client_error(e)
+
+    async def sse():
+        try:
+            async for ev in astream_text(
+                prompt, chat_id,
+                use_cache=bool(payload.get("use_cache", True)),
+                debug=bool(payload.get("debug", False)),
+                **rag_params,
+            ):
+                yield f"event: {ev['event']}\ndata: {json.dumps(ev['data'], ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(e)
+            yield f"event: error\ndata: {json.dumps({'error': 'Error interno del servidor'})}\n\n"
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        # Evita que proxies (nginx) acumulen la respuesta antes de enviarla
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,160 @@
+# metrics.py
+# Métricas en proceso con exposición en formato texto de Prometheus (/metrics).
+# Sin dependencias: histogramas, contadores y gauges mínimos, thread-safe.
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_pre_render_hooks: List[Callable[[], None]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [conteo por bucket..., suma, total]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = self.header()
+        for key, row in items:
+            cumulative = 0.0
+            for i, b in enumerate(self.buckets):
+                cumulative += row[i]
+                le = 'le="' + _fmt_value(b) + '"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {_fmt_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(row[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {_fmt_value(row[-1])}")
+        return lines
+
+
+def add_pre_render_hook(fn: Callable[[], None]) -> None:
+    """
+    `fn` se llama antes de cada render (ej. para copiar stats de cachés a gauges).
+    """
+    _pre_render_hooks.append(fn)
+
+
+def render() -> str:
+    for fn in _pre_render_hooks:
+        try:
+            fn()
+        except Exception as e:
+            print("Error en hook de métricas:", e)
+    lines: List[str] = []
+    for m in _registry:
+        lines.extend(m.collect())
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Métricas del pipeline RAG
+# -----------------------------
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latencia por etapa del pipeline RAG (normalize, embedding, chroma_query, retrieval, context_build, prompt_render, llm, llm_ttft)",
+    ["stage"],
+)
+
+
+def span(stage: str):
+    """
+    with span("embedding"): ...  -> observa la duración en rag_stage_seconds{stage=...}
+    """
+    return STAGE_SECONDS.time(stage=stage)
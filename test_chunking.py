@@ -0,0 +1,39 @@
+# Regresión del chunking por oraciones: el overlap nunca debe producir un
+# chunk contenido en el anterior (embeddings duplicados que ocupan top_k).
+# Uso: python test_chunking.py   (o pytest test_chunking.py)
+from pathlib import Path
+
+from bd.chunking import STRATEGIES, chunk_text
+
+DATA_DIR = Path(__file__).resolve().parent / "data_txt"
+
+
+def _assert_advances(chunks, label):
+    spans = [(c.start, c.end) for c in chunks]
+    for prev, cur in zip(spans, spans[1:]):
+        assert cur[1] > prev[1], f"{label}: {cur} no avanza respecto de {prev} ({spans})"
+
+
+def test_long_sentence_after_full_window():
+    # Oraciones que llenan la ventana y luego una más larga que el overlap
+    text = " ".join(f"Oración corta número {i} sobre el molino." for i in range(19))
+    text += " " + "palabra " * 100 + "fin."
+    chunks = chunk_text(text, "sentences", 800, 120)
+    _assert_advances(chunks, "defaults")
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+    for c in chunks:
+        assert text[c.start:c.end] == c.text
+
+
+def test_data_txt_chunks_advance():
+    for path in sorted(DATA_DIR.glob("*.txt")):
+        text = path.read_text(encoding="utf-8")
+        for strategy in STRATEGIES:
+            for size, overlap in ((800, 120), (300, 60)):
+                _assert_advances(chunk_text(text, strategy, size, overlap), f"{path.name} {strategy} {size}/{overlap}")
+
+
+if __name__ == "__main__":
+    test_long_sentence_after_full_window()
+    test_data_txt_chunks_advance()
+    print("OK")
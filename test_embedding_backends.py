@@ -0,0 +1,63 @@
+# Abre una colección de Chroma con cada EMBEDDING_BACKEND: nueva, y una ya
+# creada con otro backend del mismo modelo. Cada backend corre en su propio
+# proceso (la configuración se lee del entorno al importar bd.chroma_store)
+# sobre un CHROMA_DIR temporal.
+# Uso: python test_embedding_backends.py   (o pytest test_embedding_backends.py)
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from bd.embeddings import BACKENDS, EMBEDDING_MODEL
+
+MODEL = os.getenv("TEST_EMBEDDING_MODEL", EMBEDDING_MODEL)
+ROOT = Path(__file__).resolve().parent
+
+# Se ejecuta en el proceso hijo: argv[1] = colección, argv[2] = "create" o "open"
+CHILD = r"""
+import sys
+from bd import chroma_store as cs
+
+name, action = sys.argv[1], sys.argv[2]
+if action == "create":
+    cs.upsert_docs(
+        ["d1", "d2"],
+        ["El pH de la pulpa afecta la flotación de cobre.", "La potencia del molino SAG depende de la carga."],
+        [{"source": "a.txt"}, {"source": "b.txt"}],
+        collection=name,
+    )
+store = cs.get_store(name)
+store.warmup()
+hits = cs.search("¿Qué afecta la flotación?", top_k=2, distance_threshold=None, mode="vector", collection=name)
+assert [h["id"] for h in hits][:1] == ["d1"], hits
+print(store.embedding_model, cs.count(name))
+"""
+
+
+def _run(backend: str, chroma_dir: str, collection: str, action: str) -> str:
+    env = {**os.environ, "CHROMA_DIR": chroma_dir, "EMBEDDING_BACKEND": backend, "EMBEDDING_MODEL": MODEL}
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, collection, action],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    assert proc.returncode == 0, f"{backend} {action} {collection}:\n{proc.stdout}\n{proc.stderr}"
+    return proc.stdout.strip().splitlines()[-1]
+
+
+def test_open_collection_with_each_backend():
+    with tempfile.TemporaryDirectory() as tmp:
+        chroma_dir = str(Path(tmp) / "chroma_db")
+        _run("sentence-transformers", chroma_dir, "shared", "create")
+        for backend in BACKENDS:
+            slug = backend.replace("-", "_")
+            # Colección nueva creada con este backend
+            assert _run(backend, chroma_dir, f"fresh_{slug}", "create") == f"{MODEL} 2"
+            # Colección existente creada con sentence-transformers
+            assert _run(backend, chroma_dir, "shared", "open") == f"{MODEL} 2"
+            print(f"{backend}: OK")
+
+
+if __name__ == "__main__":
+    test_open_collection_with_each_backend()
+    print("OK")
@@ -0,0 +1,48 @@
+# Verifica que el path ONNX Runtime (bd.onnx_embed) entrega embeddings
+# numéricamente cercanos a los de sentence-transformers (torch) del mismo modelo.
+# Uso: python test_onnx_embeddings.py   (o pytest test_onnx_embeddings.py)
+# La primera corrida exporta el modelo a ONNX_CACHE_DIR.
+import os
+import time
+
+import numpy as np
+
+from bd.embeddings import EMBEDDING_MODEL, EmbeddingConfig, SentenceTransformerBackend
+from bd.onnx_embed import OnnxEmbeddingFunction
+
+MODEL = os.getenv("TEST_EMBEDDING_MODEL", EMBEDDING_MODEL)
+
+TEXTS = [
+    "¿Qué variables afectan la potencia del molino SAG?",
+    "¿Cómo influye el pH en la flotación de cobre?",
+    "Un incremento del torque puede indicar floculación deficiente.",
+    "SAG",
+    "La dosificación de colectores (xantatos) y espumantes define la estabilidad de la espuma " * 20,
+]
+
+# Similitud coseno mínima por variante (int8 pierde algo de precisión)
+MIN_COSINE = {False: 0.999, True: 0.98}
+
+
+def _cosine(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def test_onnx_matches_torch():
+    reference = SentenceTransformerBackend(EmbeddingConfig(model=MODEL, backend="sentence-transformers"))(TEXTS)
+    for quantized in (False, True):
+        t0 = time.perf_counter()
+        got = OnnxEmbeddingFunction(MODEL, quantized=quantized)(TEXTS)
+        dt = time.perf_counter() - t0
+        cos = _cosine(reference, got)
+        print(f"{MODEL} onnx {'int8' if quantized else 'fp32'}: coseno min {cos.min():.5f} ({dt:.2f}s)")
+        assert np.asarray(got).shape == np.asarray(reference).shape
+        assert cos.min() >= MIN_COSINE[quantized], cos
+        if not quantized:
+            np.testing.assert_allclose(got, reference, atol=1e-3, rtol=1e-2)
+
+
+if __name__ == "__main__":
+    test_onnx_matches_torch()
+    print("OK")
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import time
 
 API_BASE_DEFAULT = "http://127.0.0.1:8000"
@@ -30,6 +31,7 @@ with st.sidebar:
 
     st.subheader("Retrieval")
     top_k = st.slider("top_k", 1, 10, 3)
+    max_tokens = st.slider("max_tokens contexto", 200, 6000, 1500, step=100)
     max_chars = st.slider("max_chars por doc", 300, 6000, 2000, step=100)
 
     st.subheader("Debug")
@@ -39,6 +41,11 @@ with st.sidebar:
 
     st.divider()
     if st.button("🧹 Limpiar chat"):
+        # También borra la memoria de conversación del backend
+        try:
+            requests.delete(f"{api_base}/chats/{st.session_state.chat_id}", timeout=10)
+        except requests.RequestException:
+            pass
         st.session_state.history = []
         st.session_state.last_debug = None
         st.rerun()
@@ -65,6 +72,19 @@ def post_json(url: str, payload: dict, timeout: int = 120):
     dt = time.time() - t0
     return r, dt
 
+def iter_sse(resp):
+    """
+    Parser mínimo de server-sent events -> (event, data_json).
+    """
+    event = "message"
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            yield event, json.loads(line[len("data:"):].strip())
+
 def build_prompt_template(question: str, context: str) -> dict:
     system = (
         "Eres un asistente técnico senior de metalurgia y procesamiento de minerales en una planta concentradora.\n"
@@ -93,10 +113,6 @@ def prompt_metrics(prompt_obj: dict) -> dict:
         "total_chars": len(sys_txt) + len(usr_txt),
     }
 
-def looks_like_no_llm_reply(text: str) -> bool:
-    t = (text or "").lower()
-    return ("modo sin llm" in t) or ("no se llama al modelo" in t) or ("prompt renderizado" in t) or ("llm no disponible" in t)
-
 # -----------------------------
 # On user message
 # -----------------------------
@@ -118,19 +134,24 @@ if user_msg:
     payload_debug = {
         "query": user_msg,
         "top_k": top_k,
+        "max_tokens": max_tokens,
         "max_chars": max_chars
     }
 
-    # Always fetch rag_debug (needed to build the prompt + show retrieval on right)
-    rag_url = f"{api_base}/rag_debug"
-    r_rag, dt_rag = post_json(rag_url, payload_debug)
-    rag_data = r_rag.json() if r_rag.status_code == 200 else None
-
-    context = (rag_data or {}).get("context", "")
-    prompt_obj = build_prompt_template(user_msg, context) if rag_data else None
-    metrics = prompt_metrics(prompt_obj) if prompt_obj else None
+    def prompt_from(rag_data):
+        # Preferimos el prompt real del backend; el template local es respaldo
+        if not rag_data:
+            return None
+        return rag_data.get("prompt") or build_prompt_template(user_msg, rag_data.get("context", ""))
 
     if mode == "SIN LLM":
+        # Solo retrieval + prompt: una llamada a /rag_debug
+        rag_url = f"{api_base}/rag_debug"
+        r_rag, dt_rag = post_json(rag_url, payload_debug)
+        rag_data = r_rag.json() if r_rag.status_code == 200 else None
+        prompt_obj = prompt_from(rag_data)
+        metrics = prompt_metrics(prompt_obj) if prompt_obj else None
+
         with col_chat:
             with st.chat_message("assistant"):
                 if rag_data is None:
@@ -159,21 +180,43 @@ if user_msg:
         }
 
     else:
-        url = f"{api_base}/messages"
-        r_msg, dt_msg = post_json(url, payload_messages)
+        # Streaming: la respuesta se va pintando a medida que llegan los tokens.
+        # Con "debug": true el primer evento trae hits/contexto/prompt, así que
+        # NO se llama a /rag_debug (un solo retrieval por turno).
+        payload_messages.update({
+            "debug": True,
+            "top_k": top_k,
+            "max_tokens": max_tokens,
+            "max_chars": max_chars,
+        })
+        url = f"{api_base}/messages/stream"
+        t0 = time.time()
+        r_msg = requests.post(url, json=payload_messages, stream=True, timeout=120)
+        rag_data = None
 
         with col_chat:
             with st.chat_message("assistant"):
                 if r_msg.status_code != 200:
                     st.error(f"Error {r_msg.status_code}: {r_msg.text}")
                 else:
-                    data = r_msg.json()
-                    reply = data.get("response", "")
+                    events = iter_sse(r_msg)
+                    # Primer evento: retrieval (modo + hits + contexto + prompt)
+                    ev, meta = next(events, (None, {}))
+                    if ev == "retrieval":
+                        rag_data = {
+                            "hits": meta.get("raw_hits", []),
+                            "context": meta.get("context", ""),
+                            "context_tokens": meta.get("context_tokens"),
+                            "prompt": meta.get("prompt"),
+                        }
+                    prompt_obj = prompt_from(rag_data)
+                    metrics = prompt_metrics(prompt_obj) if prompt_obj else None
 
                     # If backend fell back to no-llm, show prompt in chat (as requested)
-                    if looks_like_no_llm_reply(reply):
-                        if rag_data is None:
-                            fallback = "⚠️ **LLM no disponible (modo CON LLM)**, y además falló /rag_debug, así que no puedo armar el prompt."
+                    if ev == "retrieval" and meta.get("mode") == "no_llm":
+                        r_msg.close()
+                        if prompt_obj is None:
+                            fallback = "⚠️ **LLM no disponible (modo CON LLM)**, y además no llegó el contexto, así que no puedo armar el prompt."
                             st.warning(fallback)
                             st.session_state.history.append(("assistant", fallback))
                         else:
@@ -189,15 +232,24 @@ if user_msg:
                             st.markdown(fallback)
                             st.session_state.history.append(("assistant", fallback))
                     else:
-                        st.markdown(reply)
+                        def tokens():
+                            for ev, data in events:
+                                if ev == "token":
+                                    yield data.get("delta", "")
+                                elif ev == "error":
+                                    yield f"\n\n⚠️ {data.get('error', 'Error')}"
+
+                        reply = st.write_stream(tokens())
                         st.session_state.history.append(("assistant", reply))
 
+        dt_msg = time.time() - t0
+
         st.session_state.last_debug = {
             "mode": "CON LLM",
-            "endpoint": "/messages",
+            "endpoint": "/messages/stream",
             "latency_s": dt_msg,
             "payload": payload_messages,
-            "rag_debug_payload": payload_debug,
+            "rag_debug_payload": None,
             "rag_debug": rag_data,
         }
 
@@ -239,6 +291,9 @@ with col_debug:
                             st.write((h.get("text") or "")[:1200])
 
             if show_context:
+                ctx_tokens = rag_debug.get("context_tokens") or {}
+                if ctx_tokens:
+                    st.caption(f"Tokens contexto: {ctx_tokens.get('tokens_used')} / {ctx_tokens.get('budget')}")
                 st.markdown("### Contexto armado (concatenado)")
                 st.text_area("context", value=rag_debug.get("context", ""), height=320)
         else: